@@ -1,27 +1,967 @@
-import requests
-import csv
-from os import  path
-import webbrowser
+# requests, csv, sqlite3, click, webbrowser and the process pool (which
+# brings in multiprocessing) are imported where they are used, so a run
+# that does not need them (or has its answer cached) starts quickly from
+# cron and scripts.
+import gzip
+from os import  path, makedirs, remove, environ
 import datetime
-import click
 import json
 import time
 import random 
+import re
+import secrets
+import hashlib
+import struct
 import configparser
+import contextlib
+import functools
+import argparse
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 
+# orjson is optional; when installed it decodes API pages several times faster
+try:
+    import orjson
+    decode_json = orjson.loads
+except ImportError:
+    decode_json = json.loads
+
+class RateLimitScheduler:
+    # Twitter reports the quota left in each rate-limit window through the
+    # x-rate-limit-remaining / x-rate-limit-reset response headers. Each
+    # bucket spends those tokens as fast as it likes and only sleeps once
+    # the window is used up. Until a bucket has seen any headers, requests
+    # are spaced by fallback_interval instead. Limits the headers do not
+    # show (e.g. full-archive search's one request per second) are kept
+    # with set_min_interval.
+    _RESET_MARGIN = 1.0
+    _DEFAULT_WINDOW = 15 * 60
+
+    def __init__(self, fallback_interval: float):
+        self._fallback_interval = fallback_interval
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._min_intervals = {}
+
+    def set_min_interval(self, bucket: str, seconds: float):
+        with self._lock:
+            self._min_intervals[bucket] = max(seconds, self._min_intervals.get(bucket, 0.0))
+
+    def _bucket(self, bucket: str):
+        if bucket not in self._buckets:
+            self._buckets[bucket] = {"remaining": None, "reset": None, "last_request": None}
+        return self._buckets[bucket]
+
+    def wait(self, bucket: str):
+        # Work out (and reserve) this request's slot under the lock, then
+        # sleep outside of it so other buckets are not held up. Returns the
+        # seconds slept and whether that was spacing (fallback or minimum
+        # interval) rather than waiting for a used-up window to reset.
+        with self._lock:
+            state = self._bucket(bucket)
+            now = time.monotonic()
+            delay = 0.0
+            spacing = 0.0
+
+            if state["reset"] is not None and state["reset"] <= time.time():
+                # The window has rolled over, so the old count no longer applies
+                state["remaining"] = None
+                state["reset"] = None
+
+            interval = self._min_intervals.get(bucket, 0.0)
+            if state["remaining"] is None:
+                interval = max(interval, self._fallback_interval)
+            elif state["remaining"] > 0:
+                state["remaining"] -= 1
+            else:
+                delay = max(0.0, state["reset"] - time.time() + self._RESET_MARGIN)
+
+            if state["last_request"] is not None:
+                spacing = max(0.0, state["last_request"] + interval - now)
+            paced = spacing > delay
+            delay = max(delay, spacing)
+
+            state["last_request"] = now + delay
+
+        if delay > 0:
+            time.sleep(delay)
+        return delay, paced
+
+    def update(self, bucket: str, headers):
+        remaining = headers.get("x-rate-limit-remaining")
+        reset = headers.get("x-rate-limit-reset")
+        if remaining is None or reset is None:
+            return
+
+        with self._lock:
+            state = self._bucket(bucket)
+            state["remaining"] = int(remaining)
+            state["reset"] = float(reset)
+
+    def exhausted(self, bucket: str, headers):
+        # Called on a 429: nothing more can be sent until the window resets
+        reset = headers.get("x-rate-limit-reset")
+        with self._lock:
+            state = self._bucket(bucket)
+            state["remaining"] = 0
+            state["reset"] = float(reset) if reset is not None else time.time() + self._DEFAULT_WINDOW
+            return max(0.0, state["reset"] - time.time())
+
+
+class FetchMetrics:
+    # Per-endpoint request statistics plus wall time per phase, so a slow
+    # run can be pinned on the API, on our own pacing, or on local CPU.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._phases = {}
+
+    def _endpoint(self, bucket: str):
+        if bucket not in self._endpoints:
+            self._endpoints[bucket] = {
+                "requests": 0,
+                "latencies": [],
+                "bytes": 0,
+                "decode_seconds": 0.0,
+                "retries": 0,
+                "rate_limited": 0,
+                "wait_seconds": 0.0,
+                "pacing_seconds": 0.0
+            }
+        return self._endpoints[bucket]
+
+    def record_request(self, bucket: str, latency: float, size: int, retries: int):
+        with self._lock:
+            endpoint = self._endpoint(bucket)
+            endpoint["requests"] += 1
+            endpoint["latencies"].append(latency)
+            endpoint["bytes"] += size
+            endpoint["retries"] += retries
+
+    def record_decode(self, bucket: str, seconds: float):
+        with self._lock:
+            self._endpoint(bucket)["decode_seconds"] += seconds
+
+    def record_wait(self, bucket: str, seconds: float, paced: bool = False):
+        with self._lock:
+            self._endpoint(bucket)["pacing_seconds" if paced else "wait_seconds"] += seconds
+
+    def record_rate_limited(self, bucket: str):
+        with self._lock:
+            self._endpoint(bucket)["rate_limited"] += 1
+
+    def record_phase(self, name: str, seconds: float):
+        with self._lock:
+            self._phases[name] = self._phases.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_phase(name, time.perf_counter() - started)
+
+    def as_dict(self):
+        with self._lock:
+            endpoints = {}
+            for bucket, endpoint in self._endpoints.items():
+                latencies = sorted(endpoint["latencies"])
+                endpoints[bucket] = {
+                    "requests": endpoint["requests"],
+                    "request_seconds": sum(latencies),
+                    "latency_p50_seconds": latencies[len(latencies) // 2] if latencies else 0.0,
+                    "latency_p95_seconds": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+                    "bytes_received": endpoint["bytes"],
+                    "json_decode_seconds": endpoint["decode_seconds"],
+                    "retries": endpoint["retries"],
+                    "rate_limited": endpoint["rate_limited"],
+                    "rate_limit_wait_seconds": endpoint["wait_seconds"],
+                    "pacing_wait_seconds": endpoint["pacing_seconds"]
+                }
+            return {"endpoints": endpoints, "phases": dict(self._phases)}
+
+    def print_report(self):
+        metrics = self.as_dict()
+
+        print("{:<12}{:>9}{:>10}{:>10}{:>10}{:>10}{:>9}{:>7}{:>10}{:>10}".format(
+            "Endpoint", "Requests", "API (s)", "p95 (s)", "MB", "JSON (s)", "Retries", "429s", "Wait (s)", "Pace (s)"))
+        for bucket, endpoint in metrics["endpoints"].items():
+            print("{:<12}{:>9}{:>10.2f}{:>10.3f}{:>10.2f}{:>10.3f}{:>9}{:>7}{:>10.2f}{:>10.2f}".format(
+                bucket,
+                endpoint["requests"],
+                endpoint["request_seconds"],
+                endpoint["latency_p95_seconds"],
+                endpoint["bytes_received"] / (1024 * 1024),
+                endpoint["json_decode_seconds"],
+                endpoint["retries"],
+                endpoint["rate_limited"],
+                endpoint["rate_limit_wait_seconds"],
+                endpoint["pacing_wait_seconds"]))
+
+        print()
+        for name, seconds in metrics["phases"].items():
+            print("{:<30}{:>10.2f}s".format(name, seconds))
+
+        # Crawls can overlap, so these sums may exceed the total run time
+        waiting = sum(endpoint["rate_limit_wait_seconds"] for endpoint in metrics["endpoints"].values())
+        pacing = sum(endpoint["pacing_wait_seconds"] for endpoint in metrics["endpoints"].values())
+        requesting = sum(endpoint["request_seconds"] for endpoint in metrics["endpoints"].values())
+        print("{:<30}{:>10.2f}s".format("Waiting on rate limits", waiting))
+        # Before an endpoint has sent rate-limit headers (and always on
+        # full-archive search), requests are spaced out
+        print("{:<30}{:>10.2f}s".format("Spacing out requests", pacing))
+        print("{:<30}{:>10.2f}s".format("Waiting on the API", requesting))
+
+    def to_prometheus(self):
+        metrics = self.as_dict()
+        lines = []
+        for name, key, help_text in (
+                ("giveaway_requests_total", "requests", "HTTP requests made"),
+                ("giveaway_request_seconds_total", "request_seconds", "Time spent waiting for responses"),
+                ("giveaway_response_bytes_total", "bytes_received", "Response bytes received"),
+                ("giveaway_json_decode_seconds_total", "json_decode_seconds", "Time spent decoding JSON"),
+                ("giveaway_retries_total", "retries", "Requests retried after a server or connection error"),
+                ("giveaway_rate_limited_total", "rate_limited", "429 responses received"),
+                ("giveaway_rate_limit_wait_seconds_total", "rate_limit_wait_seconds", "Time spent waiting for used-up rate limits to reset"),
+                ("giveaway_pacing_wait_seconds_total", "pacing_wait_seconds", "Time spent spacing out requests to stay under limits the rate-limit headers do not show")):
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, "counter"))
+            for bucket, endpoint in metrics["endpoints"].items():
+                lines.append('{}{{endpoint="{}"}} {}'.format(name, bucket, endpoint[key]))
+
+        lines.append("# HELP giveaway_phase_seconds Wall time spent in each phase")
+        lines.append("# TYPE giveaway_phase_seconds gauge")
+        for phase, seconds in metrics["phases"].items():
+            lines.append('giveaway_phase_seconds{{phase="{}"}} {}'.format(phase, seconds))
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename: str, metrics_format: str):
+        with open(filename, 'w', encoding="UTF-8") as file:
+            if metrics_format == "prometheus":
+                file.write(self.to_prometheus())
+            else:
+                file.write(json.dumps(self.as_dict(), indent=2))
+
+
+class OfflineResponse:
+    # The parts of a requests.Response that AutomaticTwitterGiveaways reads
+    def __init__(self, status_code: int, text: str, headers: dict = None):
+        self.status_code = status_code
+        from requests.structures import CaseInsensitiveDict
+
+        self.text = text
+        self.content = text.encode("UTF-8")
+        self.headers = CaseInsensitiveDict(headers or {})
+
+
+class RecordingSession:
+    # Wraps a real session and saves every response to record_dir, keyed by
+    # URL, so a run can be replayed later without the Twitter API.
+    _RECORDED_HEADERS = ("content-type", "x-rate-limit-limit", "x-rate-limit-remaining", "x-rate-limit-reset")
+
+    def __init__(self, session, record_dir: str):
+        self._session = session
+        self._record_dir = record_dir
+        makedirs(self._record_dir, exist_ok=True)
+
+    @property
+    def headers(self):
+        return self._session.headers
+
+    def get(self, url: str, **kwargs):
+        r = self._session.get(url, **kwargs)
+        with open(recorded_response_filename(self._record_dir, url), 'w', encoding="UTF-8") as file:
+            file.write(json.dumps({
+                "url": url,
+                "status_code": r.status_code,
+                "headers": {key: r.headers[key] for key in self._RECORDED_HEADERS if key in r.headers},
+                "body": r.text
+            }))
+        return r
+
+
+class ReplaySession:
+    # Serves responses saved by RecordingSession. Each request can be slowed
+    # by latency seconds. The recorded rate-limit headers are long out of
+    # date, so they are replaced: given rate_limit, each endpoint allows
+    # that many requests per window seconds and answers 429 past that, much
+    # like the real API; without it there is no limit at all.
+    _UNLIMITED = 10 ** 9
+
+    def __init__(self, replay_dir: str = None, latency: float = 0.0, rate_limit: int = None, window: float = 15 * 60):
+        self._replay_dir = replay_dir
+        self._latency = latency
+        self._rate_limit = rate_limit
+        self._window = window
+        self._lock = threading.Lock()
+        self._windows = {}
+        self.headers = {}
+        self.request_count = 0
+
+    def _respond(self, url: str):
+        filename = recorded_response_filename(self._replay_dir, url)
+        if not path.isfile(filename):
+            return 404, json.dumps({"errors": [{"message": "No recorded response for {}".format(url)}]}), {}
+        with open(filename, 'r', encoding="UTF-8") as file:
+            recorded = json.loads(file.read())
+        return recorded["status_code"], recorded["body"], recorded["headers"]
+
+    def _rate_limit_headers(self, url: str):
+        endpoint = url.split("?")[0]
+        with self._lock:
+            self.request_count += 1
+            now = time.time()
+            reset, used = self._windows.get(endpoint, (now + self._window, 0))
+            if reset <= now:
+                reset, used = now + self._window, 0
+            used += 1
+            self._windows[endpoint] = (reset, used)
+
+        # Headers with a quota that never runs out still keep the scheduler
+        # from spacing requests out as it does before it has seen any
+        limit = self._rate_limit if self._rate_limit is not None else self._UNLIMITED
+        return used > limit, {
+            "x-rate-limit-limit": str(limit),
+            "x-rate-limit-remaining": str(max(0, limit - used)),
+            "x-rate-limit-reset": str(int(reset))
+        }
+
+    def get(self, url: str, **kwargs):
+        if self._latency:
+            time.sleep(self._latency)
+
+        limited, rate_limit_headers = self._rate_limit_headers(url)
+        if limited:
+            return OfflineResponse(429, json.dumps({"title": "Too Many Requests", "status": 429}), rate_limit_headers)
+
+        status_code, body, headers = self._respond(url)
+        headers = dict(headers)
+        headers.update(rate_limit_headers)
+        return OfflineResponse(status_code, body, headers)
+
+
+def recorded_response_filename(directory: str, url: str):
+    return path.join(directory, "{}.json".format(hashlib.sha256(url.encode("UTF-8")).hexdigest()[:32]))
+
+
+class FollowerCache:
+    # SQLite snapshot of each account's followers, reused across runs. A
+    # snapshot older than ttl_hours is thrown away and crawled again in
+    # full, which is also how unfollows eventually drop out of it. The
+    # account's own user id is kept too, so a run need not look it up
+    # every time. Ids never change, but a username can be given up and
+    # taken by another account, so the mapping is still checked once a
+    # month.
+    _USER_ID_TTL = 30 * 24 * 60 * 60
+
+    def __init__(self, filename: str, ttl_hours: float):
+        self._filename = filename
+        self._ttl = ttl_hours * 60 * 60
+
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS followers ("
+                       "account_id TEXT NOT NULL, id TEXT NOT NULL, "
+                       "username TEXT, displayname TEXT, "
+                       "PRIMARY KEY (account_id, id))")
+            db.execute("CREATE TABLE IF NOT EXISTS snapshots ("
+                       "account_id TEXT PRIMARY KEY, taken_at REAL NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS user_ids ("
+                       "username TEXT PRIMARY KEY, id TEXT NOT NULL, looked_up_at REAL NOT NULL)")
+
+    def _connect(self):
+        import sqlite3
+
+        # A connection per call keeps the cache usable from fetcher threads
+        return sqlite3.connect(self._filename)
+
+    def is_fresh(self, account_id: str):
+        with self._connect() as db:
+            row = db.execute("SELECT taken_at FROM snapshots WHERE account_id = ?", (account_id,)).fetchone()
+        return row is not None and time.time() - row[0] < self._ttl
+
+    def user_id(self, username: str):
+        with self._connect() as db:
+            row = db.execute("SELECT id, looked_up_at FROM user_ids WHERE username = ?", (username.lower(),)).fetchone()
+        if row is None or time.time() - row[1] >= self._USER_ID_TTL:
+            return None
+        return row[0]
+
+    def save_user_id(self, username: str, user_id: str):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO user_ids (username, id, looked_up_at) VALUES (?, ?, ?)",
+                       (username.lower(), user_id, time.time()))
+
+    def known_ids(self, account_id: str):
+        with self._connect() as db:
+            rows = db.execute("SELECT id FROM followers WHERE account_id = ?", (account_id,))
+            return {row[0] for row in rows}
+
+    def load_known(self, account_id: str, known_ids: set):
+        # Streams the followers that were already in the snapshot before the
+        # current refresh, skipping the ones it just added.
+        with self._connect() as db:
+            rows = db.execute("SELECT id, username, displayname FROM followers WHERE account_id = ? ORDER BY rowid", (account_id,))
+            for user_id, username, displayname in rows:
+                if user_id in known_ids:
+                    yield {"username": username, "displayname": displayname, "id": user_id}
+
+    def add(self, account_id: str, followers: list):
+        with self._connect() as db:
+            db.executemany("INSERT OR REPLACE INTO followers (account_id, id, username, displayname) VALUES (?, ?, ?, ?)",
+                           [(account_id, f["id"], f["username"], f["displayname"]) for f in followers])
+
+    def replace(self, account_id: str, followers: list):
+        with self._connect() as db:
+            db.execute("DELETE FROM followers WHERE account_id = ?", (account_id,))
+            db.executemany("INSERT OR REPLACE INTO followers (account_id, id, username, displayname) VALUES (?, ?, ?, ?)",
+                           [(account_id, f["id"], f["username"], f["displayname"]) for f in followers])
+            db.execute("INSERT OR REPLACE INTO snapshots (account_id, taken_at) VALUES (?, ?)", (account_id, time.time()))
+
+
+class CrawlCheckpoint:
+    # Append-only NDJSON log of one crawl. Each line holds a finished page's
+    # records and the token for the page after it, so an interrupted crawl
+    # can replay what it already has and continue from the last token.
+    def __init__(self, filename: str):
+        self._filename = filename
+
+    def pages(self):
+        if not path.isfile(self._filename):
+            return
+        with open(self._filename, 'r', encoding="UTF-8") as file:
+            for line in file:
+                if not line.endswith("\n"):
+                    # Torn write from a crash; that page will be fetched again
+                    break
+                page = decode_json(line)
+                yield page["records"], page["next_token"]
+
+    def save_page(self, records: list, next_token: str):
+        with open(self._filename, 'a', encoding="UTF-8") as file:
+            file.write(json.dumps({"next_token": next_token, "records": records}) + "\n")
+
+    def clear(self):
+        if path.isfile(self._filename):
+            remove(self._filename)
+
+
+class RowWriter:
+    # Streams dict rows to a file as they arrive. The format comes from the
+    # file name: .csv, .ndjson/.jsonl or .parquet, and a trailing .gz
+    # compresses CSV and NDJSON. Parquet needs pyarrow and is written in
+    # row groups of _PARQUET_ROW_GROUP rows.
+    _PARQUET_ROW_GROUP = 10000
+
+    def __init__(self, filename: str, columns: tuple, boolean_columns: tuple = ()):
+        self._filename = filename
+        self._columns = columns
+        self._boolean_columns = boolean_columns
+        self._lock = threading.Lock()
+
+        name = filename.lower()
+        compressed = name.endswith(".gz")
+        if compressed:
+            name = name[:-len(".gz")]
+
+        if name.endswith(".parquet"):
+            if compressed:
+                raise RuntimeError("Parquet files are already compressed; remove '.gz' from '{}'.".format(filename))
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise RuntimeError("Writing '{}' needs pyarrow. Install it with: python -m pip install pyarrow".format(filename))
+            self._format = "parquet"
+            self._pyarrow = pyarrow
+            self._parquet_writer = None
+            self._buffer = []
+        elif name.endswith(".csv") or name.endswith(".ndjson") or name.endswith(".jsonl"):
+            self._format = "csv" if name.endswith(".csv") else "ndjson"
+            opener = gzip.open if compressed else open
+            self._file = opener(filename, 'wt', encoding="UTF-8", newline="")
+            if self._format == "csv":
+                import csv
+                self._csvwriter = csv.writer(self._file, delimiter=',', lineterminator='\n')
+                self._csvwriter.writerow(columns)
+        else:
+            raise RuntimeError("Cannot tell the export format of '{}'. Use .csv, .ndjson, .jsonl or .parquet (optionally with .gz).".format(filename))
+
+    def write(self, row: dict):
+        with self._lock:
+            if self._format == "csv":
+                self._csvwriter.writerow([row.get(column) for column in self._columns])
+            elif self._format == "ndjson":
+                self._file.write(json.dumps({column: row.get(column) for column in self._columns}) + "\n")
+            else:
+                self._buffer.append(row)
+                if len(self._buffer) >= self._PARQUET_ROW_GROUP:
+                    self._flush_parquet()
+
+    def _flush_parquet(self):
+        if not self._buffer:
+            return
+        # An explicit schema, so a column that is empty in the first row
+        # group does not get a different type from later ones
+        schema = self._pyarrow.schema([
+            (column, self._pyarrow.bool_() if column in self._boolean_columns else self._pyarrow.string())
+            for column in self._columns
+        ])
+        table = self._pyarrow.Table.from_pylist([{column: row.get(column) for column in self._columns} for row in self._buffer], schema=schema)
+        if self._parquet_writer is None:
+            self._parquet_writer = self._pyarrow.parquet.ParquetWriter(self._filename, schema)
+        self._parquet_writer.write_table(table)
+        self._buffer = []
+
+    def close(self):
+        with self._lock:
+            if self._format == "parquet":
+                self._flush_parquet()
+                if self._parquet_writer is not None:
+                    self._parquet_writer.close()
+            else:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class GiveawayEntrant:
+    # One per user who retweeted or commented; just enough to announce them
+    __slots__ = ("id", "username", "displayname", "retweet_url", "comment_url")
+
+    def __init__(self, user_id: str, username: str, displayname: str):
+        self.id = user_id
+        self.username = username
+        self.displayname = displayname
+        self.retweet_url = None
+        self.comment_url = None
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "username": self.username,
+            "displayname": self.displayname,
+            "retweet_url": self.retweet_url,
+            "comment_url": self.comment_url
+        }
+
+
+class QualificationIndex:
+    # Tracks who did what as sets of user ids, so qualifying is a set
+    # intersection and memory grows with unique users rather than with
+    # every tweet fetched. Followers are kept as bare ids, and once the
+    # entrants are sealed only followers who are also entrants are kept.
+    def __init__(self, keep_rule_details: bool = False):
+        self._lock = threading.Lock()
+        self._entrants = {}
+        self.retweeters = set()
+        self.commenters = set()
+        self.followers = set()
+        self._sealed = False
+
+        # Only kept when EntryRules need them: each entrant's comment texts
+        # and account creation time
+        self._keep_rule_details = keep_rule_details
+        self.comment_texts = {}
+        self.created_at = {}
+
+    def _entrant(self, user_id: str, username: str, displayname: str):
+        entrant = self._entrants.get(user_id)
+        if entrant is None:
+            entrant = self._entrants[user_id] = GiveawayEntrant(user_id, username, displayname)
+        return entrant
+
+    def add_retweet(self, retweet: dict):
+        with self._lock:
+            entrant = self._entrant(retweet["user_id"], retweet["username"], retweet["displayname"])
+            if entrant.retweet_url is None:
+                entrant.retweet_url = retweet["tweet_url"]
+            self.retweeters.add(entrant.id)
+            if self._keep_rule_details and retweet.get("created_at"):
+                self.created_at[entrant.id] = retweet["created_at"]
+
+    def add_comment(self, comment: dict):
+        with self._lock:
+            entrant = self._entrant(comment["user_id"], comment["username"], comment["displayname"])
+            if entrant.comment_url is None:
+                entrant.comment_url = comment["tweet_url"]
+            self.commenters.add(entrant.id)
+            if self._keep_rule_details:
+                self.comment_texts.setdefault(entrant.id, []).append(comment.get("text", ""))
+                if comment.get("created_at"):
+                    self.created_at[entrant.id] = comment["created_at"]
+
+    def add_follower(self, follower: dict):
+        user_id = follower["id"]
+        if not self._sealed or user_id in self._entrants:
+            self.followers.add(user_id)
+
+    def add_follower_ids(self, follower_ids: set):
+        with self._lock:
+            if self._sealed:
+                self.followers |= follower_ids & self._entrants.keys()
+            else:
+                self.followers |= follower_ids
+
+    def seal_entrants(self):
+        # Every retweet and comment is in, so followers who are not entrants
+        # can never qualify and need not be kept.
+        with self._lock:
+            self._sealed = True
+            self.followers &= self._entrants.keys()
+
+    def entrant(self, user_id: str):
+        return self._entrants[user_id]
+
+    def remove_entrants(self, user_ids: set):
+        # Drops accounts the filters ruled out after their actions were filed
+        with self._lock:
+            self.retweeters -= user_ids
+            self.commenters -= user_ids
+            self.followers -= user_ids
+            for user_id in user_ids:
+                self._entrants.pop(user_id, None)
+                self.comment_texts.pop(user_id, None)
+                self.created_at.pop(user_id, None)
+
+    def entrant_rows(self):
+        # One row per entrant with their action flags, for EntrantsFile
+        for user_id, entrant in self._entrants.items():
+            retweeted = user_id in self.retweeters
+            follows = user_id in self.followers
+            commented = user_id in self.commenters
+            yield {
+                "user_id": user_id,
+                "username": entrant.username,
+                "displayname": entrant.displayname,
+                "retweeted": retweeted,
+                "follows": follows,
+                "commented": commented,
+                "qualified": retweeted and follows and commented,
+                "retweet_url": entrant.retweet_url,
+                "comment_url": entrant.comment_url
+            }
+
+    def follow_candidates(self, include_all_retweeters: bool, include_all_entrants: bool = False):
+        # The users whose follow status still matters to the outcome (or to
+        # an output file that lists it)
+        if include_all_entrants:
+            return set(self._entrants)
+        if include_all_retweeters:
+            return set(self.retweeters)
+        return self.retweeters & self.commenters
+
+    def retweeted_and_followed(self):
+        return [self._entrants[user_id] for user_id in sorted(self.retweeters & self.followers)]
+
+    def qualified(self):
+        return [self._entrants[user_id] for user_id in sorted(self.retweeters & self.commenters & self.followers)]
+
+
+class AccountList:
+    # Usernames (with or without the @) and numeric user ids read from a
+    # text file, one per line; blank lines and # comments are skipped.
+    # Load files with load_account_list so each is read only once.
+    def __init__(self, entries):
+        self.ids = set()
+        self.usernames = set()
+        for entry in entries:
+            entry = entry.split("#")[0].strip().lstrip("@")
+            if not entry:
+                continue
+            # An all-digit line could be either
+            if entry.isdigit():
+                self.ids.add(entry)
+            self.usernames.add(entry.lower())
+
+    def __len__(self):
+        return len(self.usernames)
+
+    def matches(self, user_id: str, username: str):
+        return user_id in self.ids or username.lower() in self.usernames
+
+
+@functools.lru_cache(maxsize=None)
+def load_account_list(filename: str):
+    if not path.isfile(filename):
+        raise RuntimeError("Account list '{}' was not found.".format(filename))
+    with open(filename, 'r', encoding="UTF-8") as file:
+        return AccountList(file)
+
+
+class ActionFilter:
+    # Screens each retweet and comment as it is fetched. Overlapping time
+    # slices, resumed checkpoints and watch polls can hand over the same
+    # tweet twice, and only one retweet per author (or one copy of the
+    # same comment text) is of any use. Accounts on the blocklist are
+    # dropped outright. Ids are kept as ints to keep the sets small.
+    def __init__(self, blocklist: AccountList = None):
+        self._blocklist = blocklist
+        self._lock = threading.Lock()
+        self._retweeters = set()
+        self._comment_ids = set()
+        self._comments = set()
+        self.duplicates = 0
+        self.blocked = 0
+
+    def admit(self, action: str, record: dict):
+        if self._blocklist is not None and self._blocklist.matches(record["user_id"], record["username"]):
+            with self._lock:
+                self.blocked += 1
+            return False
+
+        with self._lock:
+            if action == "retweet":
+                key, seen = int(record["user_id"]), self._retweeters
+            else:
+                if int(record["tweet_id"]) in self._comment_ids:
+                    self.duplicates += 1
+                    return False
+                self._comment_ids.add(int(record["tweet_id"]))
+                # One hashed int per author and text is plenty to tell copies apart
+                key, seen = hash((record["user_id"], record.get("text", ""))), self._comments
+
+            if key in seen:
+                self.duplicates += 1
+                return False
+            seen.add(key)
+            return True
+
+
+class NearDuplicateDetector:
+    # Finds rings of accounts posting the same comment with small changes
+    # (usually just the tagged friends). Each comment becomes a MinHash
+    # signature over its word 3-grams, with @mentions and links removed;
+    # locality-sensitive hashing over bands of the signature finds likely
+    # matches without comparing every pair, and those are kept when the
+    # signatures agree on at least threshold of their slots (estimated
+    # Jaccard similarity). Groups spanning min_accounts or more accounts
+    # are reported. Comments under min_words words are skipped, since
+    # short ones ("Done! #NFT") look alike without being spam.
+    _BANDS = 8
+    _ROWS = 4
+    # One 64-byte blake2b digest per 3-gram gives all 32 hash values
+    _SLOTS = struct.Struct("<32H")
+    _NOISE = re.compile(r"@\w+|https?://\S+")
+    _WORD = re.compile(r"\w+")
+
+    def __init__(self, threshold: float, min_accounts: int = 3, min_words: int = 6):
+        self._threshold = threshold
+        self._min_accounts = min_accounts
+        self._min_words = max(3, min_words)
+
+    def _signature(self, text: str):
+        words = self._WORD.findall(self._NOISE.sub(" ", text.lower()))
+        if len(words) < self._min_words:
+            return None
+        shingles = {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+        unpack = self._SLOTS.unpack
+        hashes = [unpack(hashlib.blake2b(shingle.encode("UTF-8"), digest_size=64).digest()) for shingle in shingles]
+        return tuple(map(min, zip(*hashes)))
+
+    def find_rings(self, comment_texts: dict):
+        # comment_texts: user id -> list of comment texts. Returns a list
+        # of sets of user ids.
+        authors = []
+        signatures = []
+        for user_id, texts in comment_texts.items():
+            for text in texts:
+                signature = self._signature(text)
+                if signature is not None:
+                    authors.append(user_id)
+                    signatures.append(signature)
+
+        parent = list(range(len(signatures)))
+
+        def find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        slots = self._BANDS * self._ROWS
+        for band in range(self._BANDS):
+            start = band * self._ROWS
+            buckets = {}
+            for node, signature in enumerate(signatures):
+                buckets.setdefault(signature[start:start + self._ROWS], []).append(node)
+
+            for members in buckets.values():
+                # Check each member against the bucket's first one only,
+                # so a huge ring costs O(n) instead of O(n^2) here
+                first = members[0]
+                for node in members[1:]:
+                    if find(node) == find(first):
+                        continue
+                    agreement = sum(x == y for x, y in zip(signatures[first], signatures[node])) / slots
+                    if agreement >= self._threshold:
+                        parent[find(node)] = find(first)
+
+        groups = {}
+        for node in range(len(signatures)):
+            groups.setdefault(find(node), set()).add(authors[node])
+        return [group for group in groups.values() if len(group) >= self._min_accounts]
+
+
+class EntryRules:
+    # Optional rules on top of retweet + follow + comment. An entrant whose
+    # comments don't match comment_pattern, or whose account was less than
+    # min_account_age_days old when the giveaway started, gets no entries.
+    # Everyone else gets one entry, plus entries_per_tagged_friend for each
+    # other account @mentioned in their comments (up to max_tagged_friends).
+    _MENTION = re.compile(r"@(\w{1,15})")
+
+    def __init__(self, comment_pattern: str = None, entries_per_tagged_friend: int = 0,
+                 max_tagged_friends: int = 10, min_account_age_days: float = 0.0):
+        self.comment_pattern = re.compile(comment_pattern) if comment_pattern else None
+        self.entries_per_tagged_friend = entries_per_tagged_friend
+        self.max_tagged_friends = max_tagged_friends
+        self.min_account_age_days = min_account_age_days
+
+    @property
+    def weighted(self):
+        return self.entries_per_tagged_friend > 0
+
+    def describe(self):
+        rules = []
+        if self.comment_pattern is not None:
+            rules.append("comment matches /{}/".format(self.comment_pattern.pattern))
+        if self.min_account_age_days:
+            rules.append("account at least {:g} days old".format(self.min_account_age_days))
+        if self.weighted:
+            rules.append("+{} per tagged friend (max {})".format(self.entries_per_tagged_friend, self.max_tagged_friends))
+        return ", ".join(rules)
+
+    def entries(self, username: str, created_at: str, comment_texts: list, host_username: str, giveaway_start: datetime.datetime):
+        if self.comment_pattern is not None and not any(self.comment_pattern.search(text) for text in comment_texts):
+            return 0
+
+        if self.min_account_age_days:
+            # Unknown creation times fail the rule rather than slip through
+            if not created_at:
+                return 0
+            created = datetime.datetime.strptime(created_at[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=pytz.utc)
+            if (giveaway_start - created).total_seconds() < self.min_account_age_days * 24 * 60 * 60:
+                return 0
+
+        entries = 1
+        if self.weighted:
+            not_friends = {host_username.lower(), username.lower()}
+            friends = {mention.lower() for text in comment_texts for mention in self._MENTION.findall(text)} - not_friends
+            entries += self.entries_per_tagged_friend * min(len(friends), self.max_tagged_friends)
+        return entries
+
+
+def score_entrants(rules: EntryRules, host_username: str, giveaway_start: datetime.datetime, entrants: list):
+    # Entries for each (user id, username, created_at, comment texts) tuple.
+    # Module level so a process pool can run it on chunks of entrants.
+    return [rules.entries(username, created_at, comment_texts, host_username, giveaway_start)
+            for _, username, created_at, comment_texts in entrants]
+
+
+class AliasTable:
+    # Vose's alias method: after O(n) setup, each weighted draw costs one
+    # randrange and one random() call however many entrants there are.
+    def __init__(self, weights: list):
+        count = len(weights)
+        total = float(sum(weights))
+        scaled = [weight * count / total for weight in weights]
+        self._probability = [1.0] * count
+        self._alias = list(range(count))
+
+        small = [i for i, weight in enumerate(scaled) if weight < 1.0]
+        large = [i for i, weight in enumerate(scaled) if weight >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._probability[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left is 1.0 up to rounding error
+
+    def sample(self, rng: random.Random):
+        column = rng.randrange(len(self._alias))
+        return column if rng.random() < self._probability[column] else self._alias[column]
+
+
+def weighted_sample(rng: random.Random, weights: list, count: int):
+    # Picks count distinct indexes, each with odds proportional to its
+    # weight. A draw that lands on someone already picked rebuilds the
+    # table without them, so the result depends only on rng's seed.
+    candidates = list(range(len(weights)))
+    table = AliasTable(weights)
+    picked = []
+    while len(picked) < min(count, len(weights)):
+        index = candidates[table.sample(rng)]
+        if index in picked:
+            candidates = [candidate for candidate in candidates if candidate not in picked]
+            table = AliasTable([weights[candidate] for candidate in candidates])
+            continue
+        picked.append(index)
+    return picked
+
+
+class GiveawayResult:
+    # The outcome of AutomaticTwitterGiveaways.draw(). audit is the draw's
+    # audit record, or None when nobody qualified; filtered counts what the
+    # ActionFilter and the near-duplicate check removed.
+    __slots__ = ("giveaway_tweet_id", "winners", "retweet_count", "comment_count", "qualified_count", "audit", "metrics",
+                 "filtered")
+
+    def __init__(self, giveaway_tweet_id: str, winners: list, retweet_count: int, comment_count: int,
+                 qualified_count: int, audit: dict, metrics: dict, filtered: dict):
+        self.giveaway_tweet_id = giveaway_tweet_id
+        self.winners = winners
+        self.retweet_count = retweet_count
+        self.comment_count = comment_count
+        self.qualified_count = qualified_count
+        self.audit = audit
+        self.metrics = metrics
+        self.filtered = filtered
+
+    @property
+    def winner(self):
+        return self.winners[0] if self.winners else None
+
+    def as_dict(self):
+        return {
+            "giveaway_tweet_id": self.giveaway_tweet_id,
+            "winners": [winner.as_dict() for winner in self.winners],
+            "retweet_count": self.retweet_count,
+            "comment_count": self.comment_count,
+            "qualified_count": self.qualified_count,
+            "audit": self.audit,
+            "metrics": self.metrics,
+            "filtered": self.filtered
+        }
+
+
 class AutomaticTwitterGiveaways:
     _REQUEST_TIMEOUT = 1.6
-    _SHUFFLE_ITERATIONS = 10000
+    # Full-archive search also allows only one request per second, which its
+    # rate-limit headers do not show
+    _FULL_ARCHIVE_INTERVAL = 1.0
+    _RETRY_STATUS_CODES = (500, 502, 503, 504)
+    _SEARCH_ENDPOINTS = ("recent", "all")
+    # Below this many entrants, starting a process pool costs more than it saves
+    _PARALLEL_SCORING_MIN = 20000
+    # Search refuses an end_time less than 10 seconds in the past
+    _SEARCH_END_TIME_LAG = datetime.timedelta(seconds=10)
 
     _TWITTER_API_ENDPOINT = "https://api.twitter.com/2/"
     _TWITTER_API_TWEETS = "tweets/"
     _TWITTER_API_USERS = "users/"
     _TWITTER_API_SEARCH = "search/"
-    _TWITTER_API_RETWEETS = "{}{}{}recent?query=retweets_of:{{user}}&start_time={{start_time}}&end_time={{end_time}}&max_results=100&expansions=author_id&tweet.fields=id,text,referenced_tweets&user.fields=username".format(_TWITTER_API_ENDPOINT,_TWITTER_API_TWEETS, _TWITTER_API_SEARCH)
+    _TWITTER_API_RETWEETS = "{}{}{}{{search_endpoint}}?query=retweets_of:{{user}}&start_time={{start_time}}&end_time={{end_time}}&max_results=100&expansions=author_id&tweet.fields=id,text,referenced_tweets&user.fields=username,created_at".format(_TWITTER_API_ENDPOINT,_TWITTER_API_TWEETS, _TWITTER_API_SEARCH)
     _TWITTER_API_FOLLOWERS = "{}{}{{user}}/followers?max_results=1000".format(_TWITTER_API_ENDPOINT, _TWITTER_API_USERS)
     _TWITTER_API_USER_INFO = "{}{}by/username/{{username}}".format(_TWITTER_API_ENDPOINT, _TWITTER_API_USERS)
-    _TWITTER_API_COMMENTS = "{}{}{}recent?query=conversation_id:{{conversation_id}}%20has:hashtags%20%23{{hashtag}}&expansions=author_id&max_results=100&tweet.fields=id,text&user.fields=id,name,username".format(_TWITTER_API_ENDPOINT, _TWITTER_API_TWEETS,_TWITTER_API_SEARCH)
+    _TWITTER_API_COMMENTS = "{}{}{}{{search_endpoint}}?query=conversation_id:{{conversation_id}}%20has:hashtags%20%23{{hashtag}}&start_time={{start_time}}&end_time={{end_time}}&expansions=author_id&max_results=100&tweet.fields=id,text&user.fields=id,name,username,created_at".format(_TWITTER_API_ENDPOINT, _TWITTER_API_TWEETS,_TWITTER_API_SEARCH)
 
     def __init__(self, your_user_name: str,
                  giveaway_hashtag: str, 
@@ -32,15 +972,120 @@ class AutomaticTwitterGiveaways:
                  timezone_string: str,
                  output_to_csv: bool,
                  csv_output_filename: str,
-                 debug=False):
+                 debug=False,
+                 concurrent_fetch=False,
+                 connect_timeout=5.0,
+                 read_timeout=30.0,
+                 max_retries=5,
+                 retry_backoff=1.0,
+                 session=None,
+                 follower_cache: FollowerCache = None,
+                 early_exit_followers=False,
+                 number_of_winners=1,
+                 draw_seed=None,
+                 audit_filename=None,
+                 checkpoint_dir=None,
+                 resume=False,
+                 user_id=None,
+                 scheduler: RateLimitScheduler = None,
+                 record_dir=None,
+                 timing_report=False,
+                 metrics_file=None,
+                 metrics_format="json",
+                 entrants_file=None,
+                 actions_file=None,
+                 search_endpoint="recent",
+                 search_slices=1,
+                 progress=None,
+                 entry_rules=None,
+                 scoring_processes=0,
+                 blocklist=None,
+                 allowlist=None,
+                 near_duplicate_threshold=0.0,
+                 near_duplicate_min_accounts=3,
+                 near_duplicate_min_words=6,
+                 pool_size=None):
         self._debug = debug
+        self._concurrent_fetch = concurrent_fetch
+        # Called with an event dict instead of printing (see _print). Fetches
+        # may run on several threads, so it must be thread-safe.
+        self._progress = progress
+
+        self._metrics = FetchMetrics()
+        self._actions_writer = None
+        self._timing_report = timing_report
+        self._metrics_file = metrics_file
+        self._metrics_format = metrics_format
+
+        if search_endpoint not in self._SEARCH_ENDPOINTS:
+            raise ValueError("Search endpoint '{}' must be one of: {}".format(search_endpoint, ", ".join(self._SEARCH_ENDPOINTS)))
+        self._search_endpoint = search_endpoint
+        self._search_slices = max(1, search_slices)
+
+        self._timeout = (connect_timeout, read_timeout)
+        self._max_retries = max_retries
+        self._retry_backoff = retry_backoff
+        # Connections kept alive by the session this instance creates;
+        # run_batch sizes it for every giveaway that will share it
+        self._pool_size = pool_size
+        self._follower_cache = follower_cache
+        self._early_exit_followers = early_exit_followers
+
+        self._number_of_winners = number_of_winners
+        self._draw_seed = draw_seed
+        self._entry_rules = entry_rules
+        self._scoring_processes = scoring_processes
+
+        self._blocklist = blocklist
+        self._allowlist = allowlist
+        self._near_duplicates = None
+        if near_duplicate_threshold > 0:
+            self._near_duplicates = NearDuplicateDetector(near_duplicate_threshold,
+                                                          near_duplicate_min_accounts,
+                                                          near_duplicate_min_words)
+        # Comment texts are only kept in memory when something reads them
+        self._keep_comment_details = self._entry_rules is not None or self._near_duplicates is not None
+        # When nothing else needs every entrant's follow status, the draw
+        # walks the entrants in a seeded order and the first ones who follow
+        # win, so the follower crawl can stop as soon as those are confirmed
+        self._ordered_draw = (early_exit_followers and not output_to_csv and not entrants_file
+                              and self._entry_rules is None and self._near_duplicates is None)
+        self._seed = None
+        self._action_filter = ActionFilter(self._blocklist)
+        self._audit_filename = audit_filename
+
+        self._checkpoint_dir = checkpoint_dir
+        self._resume = resume
+        if self._checkpoint_dir:
+            makedirs(self._checkpoint_dir, exist_ok=True)
+
+        # Retweets and comments both come from the search endpoint, so they
+        # share a rate-limit bucket. Followers have a bucket of their own.
+        self._scheduler = scheduler if scheduler is not None else RateLimitScheduler(self._REQUEST_TIMEOUT)
+        if self._search_endpoint == "all":
+            self._scheduler.set_min_interval("search", self._FULL_ARCHIVE_INTERVAL)
 
         self._user_name = your_user_name
         self._bearer_token = bearer_token
+
+        # Any object with a requests-style get(url, timeout=...) will do,
+        # which lets a local fake server stand in for the Twitter API.
+        self._session = session if session is not None else self._create_session()
+        if record_dir:
+            self._session = RecordingSession(self._session, record_dir)
+        self._session.headers.update({
+            "Authorization": "Bearer {}".format(self._bearer_token),
+            "Accept-Encoding": "gzip, deflate"
+        })
+
         self._giveaway_tweet_url = giveaway_tweet_url
         self._giveaway_hashtag = giveaway_hashtag
         self._giveaway_tweet_id = self._get_tweet_id_from_url(self._giveaway_tweet_url)
-        self._user_id = self._get_userid_from_username(self._user_name)
+        # Looked up from the follower cache now, or from the API only when
+        # something first needs it (see the user_id property)
+        self._user_id = user_id
+        if self._user_id is None and self._follower_cache is not None:
+            self._user_id = self._follower_cache.user_id(self._user_name)
 
         self._timezone_string = timezone_string
 
@@ -49,52 +1094,164 @@ class AutomaticTwitterGiveaways:
 
         self._output_to_csv = output_to_csv
         self._csv_output_filename = csv_output_filename
+        self._entrants_file = entrants_file
+        self._actions_file = actions_file
 
         spaces = 5
         width = 35
-        print("Initializing AutomaticTwitterGiveaways:")
-        print("{}{:<{width}}{}".format(" " * spaces, "Username:", self._user_name, width=width))
-        print("{}{:<{width}}{}".format(" " * spaces, "UserID:", self._user_id, width=width))
-        print("{}{:<{width}}{}".format(" " * spaces, "Giveaway Hashtag:", "#{}".format(self._giveaway_hashtag), width=width))
-        print("{}{:<{width}}{}".format(" " * spaces, "Giveaway Tweet URL:", self._giveaway_tweet_url, width=width))
-        print("{}{:<{width}}{}".format(" " * spaces, "Giveaway Tweet ID:", self._giveaway_tweet_id, width=width))
-        print("{}{:<{width}}{}UTC".format(" " * spaces, "Giveaway Start Date:", self._date_start, width=width))
-        print("{}{:<{width}}{}UTC".format(" " * spaces, "Giveaway End Date:", self._date_end, width=width))
-        print("{}{:<{width}}{}".format(" " * spaces, "Output Followers & Retweets:", self._output_to_csv, width=width))
+        self._print("Initializing AutomaticTwitterGiveaways:")
+        self._print("{}{:<{width}}{}".format(" " * spaces, "Username:", self._user_name, width=width))
+        self._print("{}{:<{width}}{}".format(" " * spaces, "UserID:", self._user_id if self._user_id is not None else "(looked up when needed)", width=width))
+        self._print("{}{:<{width}}{}".format(" " * spaces, "Giveaway Hashtag:", "#{}".format(self._giveaway_hashtag), width=width))
+        self._print("{}{:<{width}}{}".format(" " * spaces, "Giveaway Tweet URL:", self._giveaway_tweet_url, width=width))
+        self._print("{}{:<{width}}{}".format(" " * spaces, "Giveaway Tweet ID:", self._giveaway_tweet_id, width=width))
+        self._print("{}{:<{width}}{}UTC".format(" " * spaces, "Giveaway Start Date:", self._date_start, width=width))
+        self._print("{}{:<{width}}{}UTC".format(" " * spaces, "Giveaway End Date:", self._date_end, width=width))
+        self._print("{}{:<{width}}{}".format(" " * spaces, "Output Followers & Retweets:", self._output_to_csv, width=width))
         if self._output_to_csv:
-            print("{}{:<{width}}{}".format(" " * spaces, "Followers & Retweets Filename:", self._csv_output_filename, width=width))
+            self._print("{}{:<{width}}{}".format(" " * spaces, "Followers & Retweets Filename:", self._csv_output_filename, width=width))
+        if self._entrants_file:
+            self._print("{}{:<{width}}{}".format(" " * spaces, "Entrants Filename:", self._entrants_file, width=width))
+        if self._actions_file:
+            self._print("{}{:<{width}}{}".format(" " * spaces, "Actions Filename:", self._actions_file, width=width))
+
+        self._print("{}{:<{width}}{}".format(" " * spaces, "Concurrent Fetch:", self._concurrent_fetch, width=width))
+        self._print("{}{:<{width}}{}s / {}s".format(" " * spaces, "Connect / Read Timeout:", self._timeout[0], self._timeout[1], width=width))
+        self._print("{}{:<{width}}{}".format(" " * spaces, "Max Retries:", self._max_retries, width=width))
+        self._print("{}{:<{width}}{}".format(" " * spaces, "Follower Cache:", self._follower_cache is not None, width=width))
+        self._print("{}{:<{width}}{} ({} slices)".format(" " * spaces, "Search Endpoint:", self._search_endpoint, self._search_slices, width=width))
+        self._print("{}{:<{width}}{}".format(" " * spaces, "Early Exit Follower Check:", self._early_exit_followers, width=width))
+        self._print("{}{:<{width}}{}".format(" " * spaces, "Number of Winners:", self._number_of_winners, width=width))
+        if self._draw_seed is not None:
+            self._print("{}{:<{width}}{}".format(" " * spaces, "Draw Seed:", self._draw_seed, width=width))
+        if self._entry_rules is not None:
+            self._print("{}{:<{width}}{}".format(" " * spaces, "Entry Rules:", self._entry_rules.describe(), width=width))
+        if self._blocklist is not None:
+            self._print("{}{:<{width}}{} accounts".format(" " * spaces, "Blocklist:", len(self._blocklist), width=width))
+        if self._near_duplicates is not None:
+            self._print("{}{:<{width}}{}".format(" " * spaces, "Near-Duplicate Comment Check:", True, width=width))
+        if self._checkpoint_dir:
+            self._print("{}{:<{width}}{}".format(" " * spaces, "Checkpoint Directory:", self._checkpoint_dir, width=width))
+            self._print("{}{:<{width}}{}".format(" " * spaces, "Resume:", self._resume, width=width))
 
         if self._debug:
-            print("{}{:<{width}}{}".format(" " * spaces, "DEBUG:", self._debug, width=width))
+            self._print("{}{:<{width}}{}".format(" " * spaces, "DEBUG:", self._debug, width=width))
 
         if len(self._bearer_token) == 0:
-            print("\n[WARN] NO BEARER TOKEN FOUND!!! PLEASE CHECK THE CONFIGURATION FILE. ERRORS WILL PROBABLY FOLLOW THIS MESSAGE.\n")
+            self._print("\n[WARN] NO BEARER TOKEN FOUND!!! PLEASE CHECK THE CONFIGURATION FILE. ERRORS WILL PROBABLY FOLLOW THIS MESSAGE.\n")
+
+    @property
+    def user_id(self):
+        if self._user_id is None:
+            self._user_id = self._get_userid_from_username(self._user_name)
+            if self._user_id is not None and self._follower_cache is not None:
+                self._follower_cache.save_user_id(self._user_name, self._user_id)
+        return self._user_id
+
+    @property
+    def giveaway_tweet_id(self):
+        return self._giveaway_tweet_id
+
+    @property
+    def session(self):
+        return self._session
+
+    def fetch_follower_ids(self):
+        return {follower["id"] for follower in self._get_followers()}
 
     def _local_time_to_utc(self, time: datetime):
-        local = pytz.timezone(self._timezone_string)
-        local_dt = local.localize(time, is_dst=None)
+        # load_giveaway_settings already hands over UTC times
+        if time.tzinfo is not None:
+            return time.astimezone(pytz.utc)
+        local_dt = get_timezone(self._timezone_string).localize(time, is_dst=None)
         return local_dt.astimezone(pytz.utc)
 
+    def _print(self, message: str = ""):
+        # All of the class's output goes through here (and the helpers
+        # below). Given a progress callback, each line becomes an event
+        # dict instead, so the class can run inside a service.
+        if self._progress is None:
+            print(message)
+        elif message.strip():
+            self._progress({"event": "message", "message": message.strip()})
+
     def _print_heading(self, message):
+        if self._progress is not None:
+            self._progress({"event": "phase", "message": message})
+            return
         print("-" * 80)
         print("{:^80}".format(message))
         print("-" * 80)
 
     def _clear_line(self):
-        print(" " * 80, end="\r")
-
-    def _get_request(self, url: str):
+        if self._progress is None:
+            print(" " * 80, end="\r")
+
+    def _print_progress(self, message, **counts):
+        if self._progress is not None:
+            self._progress(dict(counts, event="progress", message=message))
+        # Several fetchers writing "\r" lines at once only garbles the terminal
+        elif not self._concurrent_fetch:
+            print(message, end="\r")
+
+    def _create_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        # Retry 5xx responses and dropped connections with exponential
+        # backoff. 429s are left to the caller.
+        retry = Retry(total=self._max_retries,
+                      connect=self._max_retries,
+                      read=self._max_retries,
+                      status=self._max_retries,
+                      backoff_factor=self._retry_backoff,
+                      status_forcelist=self._RETRY_STATUS_CODES,
+                      allowed_methods=frozenset(["GET"]),
+                      raise_on_status=False)
+
+        # One pooled connection per concurrent fetcher (each search time
+        # slice counts as one) keeps TLS sessions alive
+        pool_size = self._pool_size or 2 * self._search_slices + 2
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _get_request(self, url: str, bucket: str):
         if self._debug:
-            print(url)
-        r =  requests.get(url,headers={
-            "Authorization": "Bearer {}".format(self._bearer_token)
-        })
+            self._print(url)
+
+        for attempt in range(self._max_retries + 1):
+            self._metrics.record_wait(bucket, *self._scheduler.wait(bucket))
+
+            started = time.perf_counter()
+            r = self._session.get(url, timeout=self._timeout)
+            latency = time.perf_counter() - started
 
-        data = json.loads(r.text)
+            # Retries made by the session's own retry policy, if it has one
+            retry_history = getattr(getattr(getattr(r, "raw", None), "retries", None), "history", None)
+            self._metrics.record_request(bucket, latency, len(r.content), len(retry_history) if retry_history else 0)
+            self._scheduler.update(bucket, r.headers)
+
+            if r.status_code != 429 or attempt == self._max_retries:
+                break
+
+            self._metrics.record_rate_limited(bucket)
+            wait_time = self._scheduler.exhausted(bucket, r.headers)
+            self._print("Rate limit reached for {} requests. Waiting {:.0f} seconds for it to reset...".format(bucket, wait_time))
+
+        # Decoded once, straight from the response bytes; callers get the
+        # parsed payload alongside the response.
+        started = time.perf_counter()
+        data = decode_json(r.content)
+        self._metrics.record_decode(bucket, time.perf_counter() - started)
         if 'errors' in data:
             if 'message' in data['errors'][0]:
                 raise RuntimeError("[FAIL] There was a problem querying the Twitter API. Please see the message below for more information.\n\n{}".format(data['errors'][0]['message']))
-        return r
+        return r, data
 
 
     def _handle_request_error(self, status_code: int):
@@ -104,18 +1261,91 @@ class AutomaticTwitterGiveaways:
     def _get_tweet_url_from_id_user(self, tweet_id:str, user_id:str):
         return "https://twitter.com/{}/status/{}".format(user_id, tweet_id)
 
-    def _pick_random_winner(self, user_list: list): 
-        # Shuffle, for good measure
-        phrase = "Shuffling entries"
-        for i in range(0, self._SHUFFLE_ITERATIONS):
-            iter = i % 3
-            suffix = "." * iter
-            print("{}{}".format(phrase, suffix), end="\r")
-            random.shuffle(user_list)
-            self._clear_line()
-        print("{}{}".format(phrase,"..."))
-
-        return random.choice(user_list)
+    def _draw_order(self, index: QualificationIndex):
+        # Everyone who retweeted and commented, sorted by id and shuffled
+        # with the draw's seed
+        order = sorted(index.retweeters & index.commenters)
+        random.Random(self._seed).shuffle(order)
+        return order
+
+    @staticmethod
+    def _verification_recipe(audit: dict, count: int):
+        # Python that re-runs the draw from the audit record alone, given the
+        # entrant ids (strings, sorted) as ids
+        rng = "random.Random({})".format("int(audit['seed'])" if audit["seed_type"] == "int" else "audit['seed']")
+        if audit.get("shuffled"):
+            return ("rng = {}; rng.shuffle(ids); winners are the first {} of ids who follow "
+                    "(the ones before them are passed_over_ids)".format(rng, count))
+        if audit.get("weighted"):
+            return ("from automatic_twitter_giveaways import weighted_sample; "
+                    "winners = [ids[i] for i in weighted_sample({}, entries, {})] "
+                    "with entries[i] the entries of ids[i]".format(rng, count))
+        return "winners = {}.sample(ids, {})".format(rng, min(count, audit["entrant_count"]))
+
+    def _pick_random_winners(self, user_list: list, count: int, entries: list = None, follower_ids: set = None):
+        # A single seeded draw. Anyone holding the audit record can follow
+        # its "verify" recipe over the same sorted entrant ids and get the
+        # same winners; the hash shows the entrant list was not changed
+        # after the fact. Given follower_ids, user_list holds
+        # everyone who retweeted and commented; they are shuffled instead
+        # and the first count of them who follow win (see _draw_order).
+        seed = self._seed
+        passed_over = None
+        if follower_ids is not None:
+            entrants = sorted(user_list, key=lambda user: user.id)
+            random.Random(seed).shuffle(entrants)
+            winners = []
+            passed_over = []
+            for user in entrants:
+                if len(winners) == count:
+                    break
+                (winners if user.id in follower_ids else passed_over).append(user)
+            entrant_lines = sorted(user.id for user in entrants)
+        elif entries is None:
+            entrants = sorted(user_list, key=lambda user: user.id)
+            winners = random.Random(seed).sample(entrants, min(count, len(entrants)))
+            entrant_lines = [user.id for user in entrants]
+        else:
+            # Weighted: weighted_sample over the sorted (id, entries) pairs,
+            # and the hash covers everyone's entries as well
+            pairs = sorted(zip(user_list, entries), key=lambda pair: pair[0].id)
+            entrants = [user for user, _ in pairs]
+            picked = weighted_sample(random.Random(seed), [weight for _, weight in pairs], count)
+            winners = [entrants[index] for index in picked]
+            entrant_lines = ["{}:{}".format(user.id, weight) for user, weight in pairs]
+
+        entrant_hash = hashlib.sha256("\n".join(entrant_lines).encode("UTF-8")).hexdigest()
+        audit = {
+            "giveaway_tweet_id": self._giveaway_tweet_id,
+            "drawn_at": datetime.datetime.now(pytz.utc).isoformat(),
+            # Random(0) and Random("0") draw differently, so the type matters
+            "seed": str(seed),
+            "seed_type": "int" if isinstance(seed, int) else "str",
+            "entrant_count": len(entrants),
+            "entrant_sha256": entrant_hash,
+            "winner_ids": [user.id for user in winners]
+        }
+        if entries is not None:
+            audit["weighted"] = True
+            audit["entry_count"] = sum(entries)
+        if passed_over is not None:
+            # Drawn before the winners but not following
+            audit["shuffled"] = True
+            audit["passed_over_ids"] = [user.id for user in passed_over]
+        audit["verify"] = self._verification_recipe(audit, count)
+
+        self._print("{:<30}{}".format("Seed:", audit["seed"]))
+        self._print("{:<30}{}".format("Entrants:", audit["entrant_count"]))
+        if entries is not None:
+            self._print("{:<30}{}".format("Entries:", audit["entry_count"]))
+        self._print("{:<30}{}".format("Entrant SHA-256:", audit["entrant_sha256"]))
+
+        if self._audit_filename:
+            with open(self._audit_filename, 'w', encoding="UTF-8") as audit_file:
+                audit_file.write(json.dumps(audit, indent=2))
+            self._print("Draw audit written to: {}".format(self._audit_filename))
+
+        return winners, audit
 
     def _get_tweet_id_from_url(self, url: str):
         # Remove last slash, if present
@@ -134,436 +1364,1110 @@ class AutomaticTwitterGiveaways:
         request_url = self._TWITTER_API_USER_INFO.format(
             username=self._user_name
         )
-        r = self._get_request(request_url)
+        r, data = self._get_request(request_url, "users")
         if r.status_code == 200:
-            data = json.loads(r.text)["data"]
-            user_id = data["id"]
+            user_id = data["data"]["id"]
             return user_id
         else:
-            print("Failed to get user information: {}".format(r.status_code))
+            self._print("Failed to get user information: {}".format(r.status_code))
             self._handle_request_error(r.status_code)
             return None
 
-    def _get_retweets(self, start_date: datetime.datetime, end_date: datetime.datetime):
-        request_url = self._TWITTER_API_RETWEETS.format(
-            user=self._user_name,
-            start_time=start_date.isoformat().replace('+00:00', 'Z'),
-            end_time=end_date.isoformat().replace('+00:00', 'Z')
-        )
-        r = self._get_request(request_url)
-
-        data = json.loads(r.text)
-        if r.status_code == 200 and 'data' in data:
-            tweets = []
-            tweet_data = data["data"]
-            user_data = data["includes"]["users"]
-
-            for tweet in tweet_data:
-                author_id = tweet["author_id"]
-                user_info = [u for u in user_data if u["id"] == author_id][0]
-                referenced_tweets = tweet["referenced_tweets"]
-                
-                is_valid_retweet = False
-                if referenced_tweets and len([t for t in referenced_tweets if t["id"] == self._giveaway_tweet_id]):
-                    is_valid_retweet = True
-
-                if is_valid_retweet:
-                    tweets.append({
-                        "tweet_id": tweet["id"],
-                        "tweet_text": tweet["text"],
-                        "author_username": user_info["username"],
-                        "tweet_url": self._get_tweet_url_from_id_user(tweet["id"], user_info["id"]),
-                        "author_displayname": user_info["name"],
-                        "author_id": user_info["id"]
-                    })
-            
-            while("next_token" in data["meta"]):
-                print("Found {} re-tweets...".format(len(tweets)), end="\r")
-                time.sleep(self._REQUEST_TIMEOUT)
-                r =  self._get_request("{}&next_token={}".format(request_url, data["meta"]["next_token"]))
-
-                if r.status_code == 200: 
-                    data = json.loads(r.text)
-                    tweet_data = data["data"]
-                    user_data += data["includes"]["users"]
-
-                    for tweet in tweet_data:
-                        author_id = tweet["author_id"]
-                        user_info = [u for u in user_data if u["id"] == author_id][0]
-
-                        referenced_tweets = tweet["referenced_tweets"]
-                        
-                        is_valid_retweet = False
-                        if referenced_tweets and len([t for t in referenced_tweets if t["id"] == self._giveaway_tweet_id]):
-                            is_valid_retweet = True
-
-                        if is_valid_retweet:
-                            tweets.append({
-                                "tweet_id": tweet["id"],
-                                "tweet_text": tweet["text"],
-                                "author_username": user_info["username"],
-                                "tweet_url": self._get_tweet_url_from_id_user(tweet["id"], user_info["id"]),
-                                "author_displayname": user_info["name"],
-                                "author_id": user_info["id"]
-                            })
+    def _with_query_param(self, url: str, key: str, value: str):
+        separator = "&" if "?" in url else "?"
+        return "{}{}{}={}".format(url, separator, key, value)
+
+    def _paginate(self, request_url: str, bucket: str, token_param: str, description: str, start_token: str = None):
+        # Yields (page, next_token) for each page of a paginated endpoint;
+        # next_token is None on the last page. The generator simply stops
+        # early if a page fails, so callers can tell a finished crawl from
+        # a partial one by whether they saw a None next_token (see
+        # _checkpointed_pages).
+        url = request_url if start_token is None else self._with_query_param(request_url, token_param, start_token)
+        while True:
+            r, data = self._get_request(url, bucket)
+
+            if r.status_code != 200:
+                self._print("Failed to get {}: {}".format(description, r.status_code))
+                self._handle_request_error(r.status_code)
+                return
+            if 'data' not in data:
+                # Nothing matched (or nothing on this page of a search)
+                data = dict(data, data=[], includes={"users": []})
+
+            next_token = data.get("meta", {}).get("next_token")
+            yield data, next_token
+
+            if next_token is None:
+                return
+            url = self._with_query_param(request_url, token_param, next_token)
+
+    def _checkpoint(self, name: str):
+        if not self._checkpoint_dir:
+            return None
+        return CrawlCheckpoint(path.join(self._checkpoint_dir, "{}-{}.ndjson".format(self._giveaway_tweet_id, name)))
+
+    def _checkpointed_pages(self, name: str, request_url: str, bucket: str, token_param: str, description: str, project_page):
+        # Yields (records, is_last_page) like _paginate, but saves each
+        # projected page and its next_token as it goes. With --resume, pages
+        # saved by an earlier, interrupted run are replayed first and the
+        # crawl carries on from the last saved token; otherwise they are
+        # thrown away, whoever calls this (e.g. fetch_follower_ids). A crawl
+        # that stops before its last page raises, leaving the checkpoint
+        # for --resume, so nobody draws from part of the entrants.
+        checkpoint = self._checkpoint(name)
+        if checkpoint and not self._resume:
+            checkpoint.clear()
+
+        next_token = None
+        resumed_pages = 0
+        if checkpoint:
+            for records, next_token in checkpoint.pages():
+                resumed_pages += 1
+                yield records, next_token is None
+
+            if resumed_pages:
+                if next_token is None:
+                    return
+                self._print("Resuming {} from checkpoint after {} pages...".format(description, resumed_pages))
+
+        finished = False
+        started = time.perf_counter()
+        try:
+            for data, next_token in self._paginate(request_url, bucket, token_param, description, next_token):
+                records = project_page(data)
+                if checkpoint:
+                    checkpoint.save_page(records, next_token)
+                finished = next_token is None
+                yield records, finished
+        finally:
+            self._metrics.record_phase("crawl {}".format(name), time.perf_counter() - started)
+
+        if not finished:
+            raise RuntimeError("Could not fetch all {}.{}".format(
+                description, " Run again with --resume to continue from where it stopped." if checkpoint else ""))
+
+    def _api_time(self, date: datetime.datetime):
+        # Search takes whole-second RFC 3339 times; slice edges may not be
+        return date.replace(microsecond=0).isoformat().replace('+00:00', 'Z')
+
+    def _time_slices(self, start_date: datetime.datetime, end_date: datetime.datetime):
+        # Splits the giveaway window into equal, back-to-back pieces. Slice
+        # edges are cut to whole seconds (see _api_time), so a slice shorter
+        # than that could start and end at the same time, which the API
+        # rejects; very short windows get fewer slices.
+        slice_count = max(1, min(self._search_slices, int((end_date - start_date).total_seconds())))
+        step = (end_date - start_date) / slice_count
+        bounds = [start_date + step * i for i in range(slice_count)] + [end_date]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def _interleave(self, generators: list):
+        # Drains each generator on its own thread and yields their items as
+        # they arrive. A bounded queue keeps fast producers from running far
+        # ahead of the consumer.
+        if len(generators) == 1:
+            yield from generators[0]
+            return
+
+        items = queue.Queue(maxsize=len(generators) * 4)
+        stop = threading.Event()
+        finished = object()
+
+        def drain(generator):
+            try:
+                for item in generator:
+                    while not stop.is_set():
+                        try:
+                            items.put((item, None), timeout=0.5)
+                            break
+                        except queue.Full:
+                            pass
+                    if stop.is_set():
+                        generator.close()
+                        return
+                items.put((finished, None))
+            except Exception as e:
+                items.put((finished, e))
+
+        threads = [threading.Thread(target=drain, args=(generator,), daemon=True) for generator in generators]
+        for thread in threads:
+            thread.start()
+
+        try:
+            remaining = len(threads)
+            while remaining:
+                item, error = items.get()
+                if item is finished:
+                    if error is not None:
+                        raise error
+                    remaining -= 1
                 else:
-                    print("Failed to make request: {}".format(r.status_code))
-                    self._handle_request_error(r.status_code)
-                    data["meta"] = {}
+                    yield item
+        finally:
+            stop.set()
+
+    def _search_pages(self, name: str, url_template: str, description: str, project_page, start_date: datetime.datetime, end_date: datetime.datetime, **query):
+        # Yields pages of projected tweets for the window, which is searched
+        # as _search_slices separate time slices in parallel.
+        slices = self._time_slices(start_date, end_date)
+        generators = []
+        for number, (slice_start, slice_end) in enumerate(slices):
+            request_url = url_template.format(
+                search_endpoint=self._search_endpoint,
+                start_time=self._api_time(slice_start),
+                end_time=self._api_time(slice_end),
+                **query
+            )
+            slice_name = name if len(slices) == 1 else "{}-{}".format(name, number)
+            pages = self._checkpointed_pages(slice_name, request_url, "search", "next_token", description, project_page)
+            generators.append(records for records, _ in pages)
+
+        if len(generators) == 1:
+            yield from generators[0]
+            return
+
+        # Slices meet at their edges, so a tweet could show up in two of them
+        seen_tweet_ids = set()
+        for records in self._interleave(generators):
+            new_records = [record for record in records if record["tweet_id"] not in seen_tweet_ids]
+            seen_tweet_ids.update(record["tweet_id"] for record in new_records)
+            yield new_records
+
+    def _project_retweets(self, data):
+        # Each slice thread gets its own page, so users are looked up per page
+        users_by_id = {u["id"]: u for u in data["includes"]["users"]}
+
+        retweets = []
+        for tweet in data["data"]:
+            referenced_tweets = tweet["referenced_tweets"]
+            if not (referenced_tweets and any(t["id"] == self._giveaway_tweet_id for t in referenced_tweets)):
+                continue
+
+            user_info = users_by_id[tweet["author_id"]]
+            # Only what the qualification index and the outputs use
+            retweets.append({
+                "tweet_id": tweet["id"],
+                "tweet_url": self._get_tweet_url_from_id_user(tweet["id"], user_info["id"]),
+                "user_id": user_info["id"],
+                "username": user_info["username"],
+                "displayname": user_info["name"],
+                "created_at": user_info.get("created_at"),
+            })
+        return retweets
+
+    def _project_replies(self, data):
+        users_by_id = {u["id"]: u for u in data["includes"]["users"]}
 
-            return tweets
+        replies = []
+        for tweet in data["data"]:
+            user_info = users_by_id[tweet["author_id"]]
+            replies.append({
+                "tweet_id": tweet["id"],
+                "tweet_url": self._get_tweet_url_from_id_user(tweet["id"], user_info["id"]),
+                "user_id": user_info["id"],
+                "username": user_info["username"],
+                "displayname": user_info["name"],
+                "created_at": user_info.get("created_at"),
+                "text": tweet["text"],
+            })
+        return replies
+
+    def _get_retweets(self, start_date: datetime.datetime, end_date: datetime.datetime):
+        count = 0
+        for retweets in self._search_pages("retweets", self._TWITTER_API_RETWEETS, "re-tweets", self._project_retweets,
+                                           start_date, end_date, user=self._user_name):
+            count += len(retweets)
+            yield from retweets
+            self._print_progress("Found {} re-tweets...".format(count), retweets=count)
 
     def _get_followers(self):
-        followers = []
+        user_id = self.user_id
+
+        # With a fresh snapshot we only need the followers gained since it was
+        # taken. The API lists newest followers first, so stop at the first
+        # page that contains someone we already know.
+        known_ids = None
+        if self._follower_cache and self._follower_cache.is_fresh(user_id):
+            known_ids = self._follower_cache.known_ids(user_id)
+            self._print("Loaded {} cached followers. Checking for new followers...".format(len(known_ids)))
 
         request_url = self._TWITTER_API_FOLLOWERS.format(
-            user=self._user_id
+            user=user_id
         )
-        r = self._get_request(request_url)
-
-        data = json.loads(r.text)
-        if r.status_code == 200 and 'data' in data: 
-            follower_data = data["data"]
-
-            # Get first line of data
-            for follower in follower_data:
-                followers.append({
-                    "username": follower["username"],
-                    "displayname": follower["name"],
-                    "id": follower["id"],
-                })
-
-            # Get additional followers until we're done
-            while "next_token" in data["meta"]:
-                print("Found {} followers...".format(len(followers)),end="\r")
-                time.sleep(self._REQUEST_TIMEOUT)
-                next_token = data["meta"]["next_token"]
-                request_url = self._TWITTER_API_FOLLOWERS.format(
-                    user=self._user_id
-                ) + "?pagination_token={}".format(next_token)
-                r = self._get_request(request_url)
-
-                if r.status_code == 200: 
-                    data = json.loads(r.text)
-                    follower_data = data["data"]
-
-                    for follower in follower_data:
-                        followers.append({
-                            "username": follower["username"],
-                            "displayname": follower["name"],
-                            "id": follower["id"],
-                        })  
-                else:
-                    print("Failed to get followers: {}".format(r.status_code))   
-                    self._handle_request_error(r.status_code)           
-                    data["meta"] = {}
-        else:
-            print("Failed to get followers: {}".format(r.status_code))
-            self._handle_request_error(r.status_code)
 
-        return followers
+        def project_page(data):
+            return [{
+                "username": follower["username"],
+                "displayname": follower["name"],
+                "id": follower["id"],
+            } for follower in data["data"]]
+
+        count = 0
+        complete = False
+        new_followers = [] if self._follower_cache else None
+        try:
+            for followers, is_last_page in self._checkpointed_pages("followers", request_url, "followers", "pagination_token", "followers", project_page):
+                reached_known = False
+
+                for follower in followers:
+                    if known_ids is not None and follower["id"] in known_ids:
+                        reached_known = True
+                        continue
+
+                    if new_followers is not None:
+                        new_followers.append(follower)
+                    count += 1
+                    yield follower
+
+                self._print_progress("Found {} followers...".format(count), followers=count)
+                complete = is_last_page or reached_known
+                if reached_known:
+                    break
+        except RuntimeError:
+            # Only a refresh of a cached snapshot has something to fall back on
+            if known_ids is None:
+                raise
+
+        if self._follower_cache and complete:
+            if known_ids is None:
+                self._follower_cache.replace(user_id, new_followers)
+            else:
+                self._follower_cache.add(user_id, new_followers)
+                yield from self._follower_cache.load_known(user_id, known_ids)
+        elif known_ids is not None:
+            # The refresh stopped part way. The snapshot is still better than
+            # no followers at all, but is not saved back: the next run would
+            # stop at the new followers and never look past the gap.
+            self._print("\n[WARN] Could not finish checking for new followers; using the {} cached followers, "
+                        "which may be out of date.".format(len(known_ids)))
+            yield from self._follower_cache.load_known(user_id, known_ids)
 
     def _get_replies(self, with_hashtag: str):
-        replies = []
-
-        request_url = self._TWITTER_API_COMMENTS.format(
-            conversation_id=self._giveaway_tweet_id,
-            hashtag=with_hashtag
-        )
-        r = self._get_request(request_url)
-
-        # First page data
-        data = json.loads(r.text)
-        if r.status_code == 200 and 'data' in data:
-            tweet_data = data["data"]
-            user_data = data["includes"]["users"]
-
-            for tweet in tweet_data:
-                author_id = tweet["author_id"]
-                user_info = [u for u in user_data if u["id"] == author_id][0]   
-
-                replies.append({
-                    "tweet_id": tweet["id"],
-                    "tweet_text": tweet["text"],
-                    "tweet_url": self._get_tweet_url_from_id_user(tweet["id"], user_info["id"]),
-                    "user_id": user_info["id"],
-                    "username": user_info["username"],
-                    "displayname": user_info["name"],
-                })
-
-            # Second -> n page data
-            while "next_token" in data["meta"]:
-                print("Found {} #{} tweet comments...".format(len(replies), with_hashtag),end="\r")
-                time.sleep(self._REQUEST_TIMEOUT)
-
-                next_token = data["meta"]["next_token"]
-
-                request_url = self._TWITTER_API_COMMENTS.format(
-                    conversation_id=self._giveaway_tweet_id,
-                    hashtag=with_hashtag
-                ) + "&next_token={}".format(next_token)
-
-                r = self._get_request(request_url)
-
-                # First page data
-                data = json.loads(r.text)
-                if r.status_code == 200 and 'data' in data:
-                    tweet_data = data["data"]
-                    user_data = data["includes"]["users"]
-
-                    for tweet in tweet_data:
-                        author_id = tweet["author_id"]
-                        user_info = [u for u in user_data if u["id"] == author_id][0]   
-
-                        replies.append({
-                            "tweet_id": tweet["id"],
-                            "tweet_text": tweet["text"],
-                            "tweet_url": self._get_tweet_url_from_id_user(tweet["id"], user_info["id"]),
-                            "user_id": user_info["id"],
-                            "username": user_info["username"],
-                            "displayname": user_info["name"],
-                        })
-
-                else:
-                    print("Failed to get more replies: {}".format(r.status_code))
-                    self._handle_request_error(r.status_code)
-                    data["meta"] = {}
-
-
-        else:
-            print("Failed to get replies: {}".format(r.status_code))
-            self._handle_request_error(r.status_code)
-
-        return replies
-
-    def _print_retweet_and_follow(self, user_actions: dict):
-        qualified_users = []
-
-        for user in user_actions:
-            user = user_actions[user]
-            
-            qualified = len(user["retweets"]) > 0 and len(user["follow"]) > 0
+        count = 0
+        for replies in self._search_pages("replies", self._TWITTER_API_COMMENTS, "replies", self._project_replies,
+                                          self._date_start, self._date_end,
+                                          conversation_id=self._giveaway_tweet_id, hashtag=with_hashtag):
+            count += len(replies)
+            yield from replies
+            self._print_progress("Found {} #{} tweet comments...".format(count, with_hashtag), comments=count)
 
-            if qualified:
-                qualified_users.append(user)
+    def _print_retweet_and_follow(self, index: QualificationIndex):
+        import csv
 
-        
         headers = ('Name', 'Username')
         with open(self._csv_output_filename, 'w', encoding="UTF-8") as file:
             csvwriter = csv.writer(file,delimiter=',', lineterminator='\n')
             csvwriter.writerow(headers)
             
-            for user in qualified_users:
-                csvwriter.writerow((user["follow"][0]["displayname"],
-                                    user["follow"][0]["username"]))
-
-
-
-    def pick_winner(self):
-
-        self._print_heading("Retrieving Retweets")
-        retweets = self._get_retweets(self._date_start, self._date_end)
-        self._clear_line()
-        print("Found {} Retweets.".format(len(retweets)))
-
-        self._print_heading("Retrieving Comments")
-        comments = self._get_replies(self._giveaway_hashtag)
-        self._clear_line()
-        print("Found {} #{} Comments.".format(len(comments), self._giveaway_hashtag))
-
-        self._print_heading("Retrieving Followers")
-        followers = self._get_followers()
-        self._clear_line()
-        print("Found {} Followers.".format(len(followers)))
-
-        user_actions = {}
-
-        # Catalog actions by user
-
-        # RETWEETS
-        for retweet in retweets:
-            user_id = retweet["author_id"]
-            if user_id not in user_actions:
-                user_actions[user_id] = {
-                    "retweets": [],
-                    "follow": [],
-                    "comments": []
-                }
-            user_actions[user_id]["retweets"].append(retweet)
-
-
-        # FOLLOWS
-        for follow in followers:
-            user_id = follow["id"]
-            if user_id not in user_actions:
-                user_actions[user_id] = {
-                    "retweets": [],
-                    "follow": [],
-                    "comments": []
-                }
-            user_actions[user_id]["follow"].append(follow)
-
+            for user in index.retweeted_and_followed():
+                csvwriter.writerow((user.displayname,
+                                    user.username))
+
+    _ACTION_COLUMNS = ("action", "user_id", "username", "displayname", "tweet_url")
+    _ENTRANT_COLUMNS = ("user_id", "username", "displayname", "retweeted", "follows", "commented",
+                        "qualified", "retweet_url", "comment_url")
+    _ENTRANT_FLAG_COLUMNS = ("retweeted", "follows", "commented", "qualified")
+
+    def _admitting(self, add_action, action: str):
+        # Passes each retweet/comment through the ActionFilter, then files
+        # it and writes it to ActionsFile as the crawl finds it
+        writer = self._actions_writer
+        action_filter = self._action_filter
+
+        def admit(record):
+            if not action_filter.admit(action, record):
+                return
+            add_action(record)
+            if writer is not None:
+                row = dict(record)
+                row["action"] = action
+                writer.write(row)
+        return admit
+
+    def _catalog_actions(self, add_action, records, stop_after_ids: set = None):
+        # Files each streamed record in the index as it arrives, so only
+        # one page of raw API data is held at a time. Given stop_after_ids,
+        # stops reading as soon as every one of those ids has been seen.
+        count = 0
+        unresolved = set(stop_after_ids) if stop_after_ids is not None else None
+        if unresolved is not None and not unresolved:
+            return count
+
+        for record in records:
+            add_action(record)
+            count += 1
+
+            if unresolved is not None:
+                unresolved.discard(record["id"])
+                if not unresolved:
+                    records.close()
+                    break
+        return count
+
+    def _fetch_concurrently(self, index: QualificationIndex, include_followers=True):
+        # The crawls are independent, so run them side by side and let the
+        # scheduler pace each rate-limit bucket on its own.
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [
+                executor.submit(self._catalog_actions, self._admitting(index.add_retweet, "retweet"),
+                                self._get_retweets(self._date_start, self._date_end)),
+                executor.submit(self._catalog_actions, self._admitting(index.add_comment, "comment"),
+                                self._get_replies(self._giveaway_hashtag))
+            ]
+            if include_followers:
+                futures.append(executor.submit(self._catalog_actions, index.add_follower,
+                                               self._get_followers()))
+
+            return [future.result() for future in futures]
+
+    def _clear_checkpoints(self):
+        names = ["followers"]
+        for name in ("retweets", "replies"):
+            names += [name, "watch-{}".format(name)]
+            names += ["{}-{}".format(name, number) for number in range(self._search_slices)]
+
+        for name in names:
+            checkpoint = self._checkpoint(name)
+            if checkpoint:
+                checkpoint.clear()
+
+    def _collect_actions(self, index: QualificationIndex, follower_ids: set = None):
+        if follower_ids is None and self._concurrent_fetch and not self._early_exit_followers:
+            self._print_heading("Retrieving Retweets, Comments & Followers")
+            retweet_count, comment_count, follower_count = self._fetch_concurrently(index)
+            self._print("Found {} Retweets.".format(retweet_count))
+            self._print("Found {} #{} Comments.".format(comment_count, self._giveaway_hashtag))
+            self._print("Found {} Followers.".format(follower_count))
+        else:
+            if self._concurrent_fetch:
+                self._print_heading("Retrieving Retweets & Comments")
+                retweet_count, comment_count = self._fetch_concurrently(index, include_followers=False)
+                self._print("Found {} Retweets.".format(retweet_count))
+                self._print("Found {} #{} Comments.".format(comment_count, self._giveaway_hashtag))
+            else:
+                self._print_heading("Retrieving Retweets")
+                retweet_count = self._catalog_actions(self._admitting(index.add_retweet, "retweet"),
+                                                      self._get_retweets(self._date_start, self._date_end))
+                self._clear_line()
+                self._print("Found {} Retweets.".format(retweet_count))
+
+                self._print_heading("Retrieving Comments")
+                comment_count = self._catalog_actions(self._admitting(index.add_comment, "comment"),
+                                                      self._get_replies(self._giveaway_hashtag))
+                self._clear_line()
+                self._print("Found {} #{} Comments.".format(comment_count, self._giveaway_hashtag))
+
+            self._collect_followers(index, follower_ids)
+
+    def _collect_followers(self, index: QualificationIndex, follower_ids: set = None):
+        # Runs once every retweet and comment is in the index
+        index.seal_entrants()
+
+        if follower_ids is not None:
+            index.add_follower_ids(follower_ids)
+            self._print("Using {} Followers fetched earlier.".format(len(follower_ids)))
+        else:
+            # Only the follow status of users who could still win (or who
+            # belong in the CSV or EntrantsFile) matters, so stop once all
+            # of them are found.
+            candidates = None
+            if self._ordered_draw:
+                # If the first NumberOfWinners in the draw order all follow,
+                # they win whoever else does
+                candidates = set(self._draw_order(index)[:self._number_of_winners])
+            elif self._early_exit_followers:
+                candidates = index.follow_candidates(self._output_to_csv, bool(self._entrants_file))
+
+            self._print_heading("Retrieving Followers")
+            follower_count = self._catalog_actions(index.add_follower,
+                                                   self._get_followers(),
+                                                   candidates)
+            self._clear_line()
+            if candidates is None:
+                self._print("Found {} Followers.".format(follower_count))
+            elif self._ordered_draw:
+                self._print("Checked {} Followers for the first {} entrants in the draw order.".format(follower_count, len(candidates)))
+            else:
+                self._print("Checked {} Followers for {} possible qualifiers.".format(follower_count, len(candidates)))
+
+    def _poll_new(self, url_template: str, description: str, project_page, since_id: str, end_date: datetime.datetime, **query):
+        # Fetches every matching tweet newer than since_id. Returns the
+        # projected records and the id of the newest tweet fetched, which is
+        # the next cursor even if projecting dropped it (e.g. a retweet of
+        # another tweet). Returns None if a page failed, so the cursor stays
+        # put and the next poll retries.
+        request_url = url_template.format(
+            search_endpoint=self._search_endpoint,
+            start_time=self._api_time(self._date_start),
+            end_time=self._api_time(end_date),
+            **query
+        )
+        if since_id is not None:
+            request_url = self._with_query_param(request_url, "since_id", since_id)
+
+        records = []
+        newest_id = None
+        for data, next_token in self._paginate(request_url, "search", "next_token", description):
+            if newest_id is None:
+                # Search lists newest first, so the first page has it
+                newest_id = data.get("meta", {}).get("newest_id") or max((tweet["id"] for tweet in data["data"]),
+                                                                         key=int, default=None)
+            records += project_page(data)
+            if next_token is None:
+                return records, newest_id
+        # An empty result is still one (empty) page, so this is a failure
+        return None
+
+    def _screen_entrants(self, index: QualificationIndex):
+        # Reports what the ActionFilter dropped during the crawl and removes
+        # accounts in near-duplicate comment rings. Returns how many were
+        # removed.
+        action_filter = self._action_filter
+        if action_filter.duplicates or action_filter.blocked:
+            self._print("Skipped {} duplicate and {} blocklisted Retweets/Comments.".format(action_filter.duplicates,
+                                                                                          action_filter.blocked))
+        if self._near_duplicates is None:
+            return 0
+
+        self._print_heading("Checking for Copy-Paste Comment Rings")
+        comment_texts = index.comment_texts
+        if self._allowlist is not None:
+            comment_texts = {user_id: texts for user_id, texts in comment_texts.items()
+                             if not self._allowlist.matches(user_id, index.entrant(user_id).username)}
+        rings = self._near_duplicates.find_rings(comment_texts)
+
+        removed = set().union(*rings) if rings else set()
+        index.remove_entrants(removed)
+        self._print("Removed {} accounts in {} near-duplicate comment rings.".format(len(removed), len(rings)))
+        return len(removed)
+
+    def _score_entrants(self, index: QualificationIndex, qualified_users: list):
+        # Regex and mention checks over every comment get CPU-bound on big
+        # giveaways, so large entrant lists are scored across processes
+        entrants = [(user.id, user.username, index.created_at.get(user.id), index.comment_texts.get(user.id, []))
+                    for user in qualified_users]
+        score = functools.partial(score_entrants, self._entry_rules, self._user_name, self._date_start)
+
+        if self._scoring_processes > 1 and len(entrants) >= self._PARALLEL_SCORING_MIN:
+            from concurrent.futures import ProcessPoolExecutor
+
+            chunk_size = -(-len(entrants) // (self._scoring_processes * 4))
+            chunks = [entrants[i:i + chunk_size] for i in range(0, len(entrants), chunk_size)]
+            with ProcessPoolExecutor(max_workers=self._scoring_processes) as pool:
+                return [entries for chunk in pool.map(score, chunks) for entries in chunk]
+        return score(entrants)
+
+    def watch(self, poll_interval: float = 60.0, follower_ids: set = None):
+        # Live mode: polls for retweets and comments newer than the last ones
+        # seen until the giveaway ends, then draws. Only the followers are
+        # crawled at the end. With a checkpoint directory the polled tweets
+        # and cursors are saved, so --resume picks a watch back up.
+        if not self._resume:
+            self._clear_checkpoints()
+
+        index = QualificationIndex(keep_rule_details=self._keep_comment_details)
+        self._action_filter = ActionFilter(self._blocklist)
+        self._actions_writer = RowWriter(self._actions_file, self._ACTION_COLUMNS) if self._actions_file else None
+        feeds = (
+            ("retweets", self._TWITTER_API_RETWEETS, "re-tweets", self._project_retweets,
+             self._admitting(index.add_retweet, "retweet"), {"user": self._user_name}),
+            ("replies", self._TWITTER_API_COMMENTS, "replies", self._project_replies,
+             self._admitting(index.add_comment, "comment"),
+             {"conversation_id": self._giveaway_tweet_id, "hashtag": self._giveaway_hashtag}),
+        )
 
-        # COMMENTS
-        for comment in comments:
-            user_id = comment["user_id"]
-            if user_id not in user_actions:
-                user_actions[user_id] = {
-                    "retweets": [],
-                    "follow": [],
-                    "comments": []
-                }
-            user_actions[user_id]["comments"].append(comment)
+        try:
+            with self._metrics.phase("watch"):
+                cursors = {}
+                for name, _, _, _, add_action, _ in feeds:
+                    checkpoint = self._checkpoint("watch-{}".format(name))
+                    if checkpoint:
+                        for records, newest_id in checkpoint.pages():
+                            for record in records:
+                                add_action(record)
+                            cursors[name] = newest_id
+
+                self._print_heading("Watching Retweets & Comments")
+                self._print("Polling every {}s until {}UTC.".format(poll_interval, self._date_end))
+                while True:
+                    now = datetime.datetime.now(pytz.utc)
+                    poll_end = min(self._date_end, now - self._SEARCH_END_TIME_LAG)
+
+                    if poll_end > self._date_start:
+                        new_counts = []
+                        for name, url_template, description, project_page, add_action, query in feeds:
+                            polled = self._poll_new(url_template, description, project_page,
+                                                    cursors.get(name), poll_end, **query)
+                            if polled is None or polled[1] is None:
+                                new_counts.append(0)
+                                continue
+
+                            records, cursors[name] = polled
+                            for record in records:
+                                add_action(record)
+                            checkpoint = self._checkpoint("watch-{}".format(name))
+                            if checkpoint:
+                                checkpoint.save_page(records, cursors[name])
+                            new_counts.append(len(records))
+
+                        self._print("[{}] {} new Retweets, {} new Comments ({} Retweeters, {} Commenters so far).".format(
+                            now.strftime("%H:%M:%S"), new_counts[0], new_counts[1],
+                            len(index.retweeters), len(index.commenters)))
+
+                    if poll_end >= self._date_end:
+                        break
+                    until_end = (self._date_end + self._SEARCH_END_TIME_LAG - now).total_seconds()
+                    time.sleep(max(0.0, min(poll_interval, until_end)))
+        finally:
+            if self._actions_writer is not None:
+                self._actions_writer.close()
+                self._actions_writer = None
+
+        return self.pick_winners(follower_ids, index)
+
+    def draw(self, follower_ids: set = None, index: QualificationIndex = None):
+        # Runs the whole giveaway and returns a GiveawayResult.
+        # follower_ids lets a caller that already has the account's
+        # followers (e.g. a batch of giveaways) skip the follower crawl.
+        # An index already holding every retweet and comment (see watch)
+        # skips their crawls.
+        run_started = time.perf_counter()
+        # Chosen up front: with an ordered draw the follower crawl needs it
+        self._seed = self._draw_seed if self._draw_seed is not None else secrets.randbits(128)
+
+        if index is not None:
+            with self._metrics.phase("fetch"):
+                self._collect_followers(index, follower_ids)
+        else:
+            if not self._resume:
+                self._clear_checkpoints()
+
+            # Catalog actions by user
+            index = QualificationIndex(keep_rule_details=self._keep_comment_details)
+            self._action_filter = ActionFilter(self._blocklist)
+            self._actions_writer = RowWriter(self._actions_file, self._ACTION_COLUMNS) if self._actions_file else None
+            try:
+                with self._metrics.phase("fetch"):
+                    self._collect_actions(index, follower_ids)
+            finally:
+                if self._actions_writer is not None:
+                    self._actions_writer.close()
+                    self._actions_writer = None
+
+        with self._metrics.phase("screening"):
+            near_duplicate_accounts = self._screen_entrants(index)
+
+        if self._entrants_file:
+            self._print_heading("Writing Entrants")
+            with self._metrics.phase("entrants output"):
+                with RowWriter(self._entrants_file, self._ENTRANT_COLUMNS, self._ENTRANT_FLAG_COLUMNS) as writer:
+                    for row in index.entrant_rows():
+                        writer.write(row)
+            self._print("Entrants written to: {}".format(self._entrants_file))
 
         if self._output_to_csv:
             self._print_heading("Printing Name/Username List")
-            self._print_retweet_and_follow(user_actions)
-            print("Done.")
+            with self._metrics.phase("csv output"):
+                self._print_retweet_and_follow(index)
+            self._print("Done.")
 
 
-        self._print_heading("Finding qualified users...")
-        qualified_users = []
-        
-
-        for user in user_actions:
-            user = user_actions[user]
-            print("{} Qualified Users...".format(len(qualified_users)), end="\r")
-            is_valid = len(user["retweets"]) > 0 and \
-                       len(user["follow"]) > 0 and \
-                       len(user["comments"]) > 0
-            if is_valid:
-                qualified_users.append(user)
-
-        self._clear_line()
-        print("Found {} Qualified Users.".format(len(qualified_users)))
+        # Everything is fetched, so a later run has nothing to resume
+        self._clear_checkpoints()
 
+        self._print_heading("Finding qualified users...")
+        with self._metrics.phase("qualification"):
+            qualified_users = index.qualified()
+        if self._ordered_draw:
+            # The follower crawl may have stopped once the winners were known
+            self._print("Found {} Qualified Users among {} who retweeted and commented.".format(
+                len(qualified_users), len(index.retweeters & index.commenters)))
+        else:
+            self._print("Found {} Qualified Users.".format(len(qualified_users)))
+
+        entries = None
+        if self._entry_rules is not None and qualified_users:
+            self._print_heading("Applying Entry Rules")
+            with self._metrics.phase("entry rules"):
+                entries = self._score_entrants(index, qualified_users)
+            eligible = [(user, weight) for user, weight in zip(qualified_users, entries) if weight > 0]
+            qualified_users = [user for user, _ in eligible]
+            entries = [weight for _, weight in eligible] if self._entry_rules.weighted else None
+            self._print("{} Users passed the entry rules ({}).".format(len(qualified_users), self._entry_rules.describe()))
+            if entries is not None:
+                self._print("{} entries in total.".format(sum(entries)))
+
+        winners = []
+        audit = None
         if len(qualified_users) > 0:
 
-            self._print_heading("Picking Winner")
-            winner = self._pick_random_winner(qualified_users)
-            self._clear_line()
-            self._print_heading("Winner Found!")
-            print("\n\n{}\n\n".format(":)"*40))
-            print("{:<30}{}".format("Name:", winner['follow'][0]['displayname']))
-            print("{:<30}{}".format("Username:", winner['follow'][0]['username']))
-            print("{:<30}{}".format("Comment URL:", winner['comments'][0]['tweet_url']))
-            print("\n\n{}\n\n".format(":)"*40))
-
-            return winner
+            self._print_heading("Picking Winner" if self._number_of_winners == 1 else "Picking Winners")
+            with self._metrics.phase("selection"):
+                if self._ordered_draw:
+                    candidates = [index.entrant(user_id) for user_id in index.retweeters & index.commenters]
+                    winners, audit = self._pick_random_winners(candidates, self._number_of_winners,
+                                                               follower_ids=index.followers)
+                else:
+                    winners, audit = self._pick_random_winners(qualified_users, self._number_of_winners, entries)
+            self._print_heading("Winner Found!" if len(winners) == 1 else "Winners Found!")
+            if self._progress is not None:
+                self._progress({"event": "winners",
+                                "message": ", ".join("@" + winner.username for winner in winners),
+                                "winners": [winner.as_dict() for winner in winners]})
+            else:
+                print("\n\n{}\n\n".format(":)"*40))
+                for winner in winners:
+                    print("{:<30}{}".format("Name:", winner.displayname))
+                    print("{:<30}{}".format("Username:", winner.username))
+                    print("{:<30}{}".format("Comment URL:", winner.comment_url))
+                    print("\n\n{}\n\n".format(":)"*40))
 
         else:
-           print("No qualified entries. Aborting.")
-           return None
+           self._print("No qualified entries. Aborting.")
+
+        self._metrics.record_phase("total", time.perf_counter() - run_started)
+        # A caller with a progress callback gets the numbers in the result
+        if self._timing_report and self._progress is None:
+            self._print_heading("Timing Report")
+            self._metrics.print_report()
+        if self._metrics_file:
+            self._metrics.write(self._metrics_file, self._metrics_format)
+            self._print("Metrics written to: {}".format(self._metrics_file))
+
+        return GiveawayResult(self._giveaway_tweet_id,
+                              winners,
+                              len(index.retweeters),
+                              len(index.commenters),
+                              len(qualified_users),
+                              audit,
+                              self._metrics.as_dict(),
+                              {"duplicates": self._action_filter.duplicates,
+                               "blocked": self._action_filter.blocked,
+                               "near_duplicate_accounts": near_duplicate_accounts})
+
+    async def draw_async(self, follower_ids: set = None, executor=None):
+        # draw() for an asyncio service. The draw runs on a worker thread
+        # (executor, or the loop's default one), so one event loop can
+        # await many giveaways at once. Progress events are handed to the
+        # callback on the event loop's thread.
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        progress = self._progress
+        if progress is not None:
+            self._progress = lambda event: loop.call_soon_threadsafe(progress, event)
+        try:
+            return await loop.run_in_executor(executor, self.draw, follower_ids)
+        finally:
+            self._progress = progress
+
+    def pick_winners(self, follower_ids: set = None, index: QualificationIndex = None):
+        return self.draw(follower_ids, index).winners
+
+    def pick_winner(self):
+        winners = self.pick_winners()
+        return winners[0] if winners else None
 
 
-def get_config_param(config: configparser.RawConfigParser, section, key, is_boolean=False):
+def get_config_param(config: configparser.RawConfigParser, section, key, is_boolean=False, default=None):
     if section in config:
         conf_sec = config[section]
         if key in conf_sec:
             if is_boolean:
                 return config.getboolean(section, key)
             return config.get(section, key)
+        elif default is not None:
+            return default
         else:
             raise RuntimeError("Key '{}' under section '{}' is required and missing from the configuration file.".format(key, section))
+    elif default is not None:
+        return default
     else:
         raise RuntimeError("Section '{}' is required and was not found in the configuration file.".format(section))
 
-if __name__ == "__main__":
-    config_file_name = 'twitter_giveaway_config.ini'
+class GiveawayConfig:
+    # The options of a config file with their types. Values come from, in
+    # order of precedence: command-line overrides (--set Key=Value), then
+    # TWITTER_GIVEAWAY_<KEY> environment variables, then the ini file. Each
+    # value is converted and checked when read, so a bad one is reported
+    # by name before any giveaway starts.
+    ENVIRONMENT_PREFIX = "TWITTER_GIVEAWAY_"
+
+    # key: (section, type)
+    _OPTIONS = {
+        "TwitterUsername": ("TwitterAuthentication", str),
+        "BearerToken": ("TwitterAuthentication", str),
+        "GiveawayTweetURL": ("GiveawayDetails", str),
+        "GiveawayTweetHashtag": ("GiveawayDetails", str),
+        "GiveawayTimezone": ("GiveawayDetails", str),
+        "GiveawayStartYear": ("GiveawayDetails", int),
+        "GiveawayStartMonth": ("GiveawayDetails", int),
+        "GiveawayStartDay": ("GiveawayDetails", int),
+        "GiveawayStartHour": ("GiveawayDetails", int),
+        "GiveawayStartMinute": ("GiveawayDetails", int),
+        "GiveawayEndYear": ("GiveawayDetails", int),
+        "GiveawayEndMonth": ("GiveawayDetails", int),
+        "GiveawayEndDay": ("GiveawayDetails", int),
+        "GiveawayEndHour": ("GiveawayDetails", int),
+        "GiveawayEndMinute": ("GiveawayDetails", int),
+        "OutputRetweetsAndFollows": ("ListOutput", bool),
+        "OutputFileName": ("ListOutput", str),
+        "EntrantsFile": ("ListOutput", str),
+        "ActionsFile": ("ListOutput", str),
+        "Debug": ("DEBUG", bool),
+        "ConcurrentFetch": ("Performance", bool),
+        "ConnectTimeout": ("Performance", float),
+        "ReadTimeout": ("Performance", float),
+        "MaxRetries": ("Performance", int),
+        "RetryBackoff": ("Performance", float),
+        "FollowerCacheFile": ("Performance", str),
+        "FollowerCacheTTLHours": ("Performance", float),
+        "SearchEndpoint": ("Performance", str),
+        "SearchSlices": ("Performance", int),
+        "EarlyExitFollowerCheck": ("Performance", bool),
+        "CheckpointDirectory": ("Performance", str),
+        "TimingReport": ("Metrics", bool),
+        "MetricsFile": ("Metrics", str),
+        "MetricsFormat": ("Metrics", str),
+        "NumberOfWinners": ("Draw", int),
+        "Seed": ("Draw", str),
+        "AuditFileName": ("Draw", str),
+        "CommentPattern": ("EntryRules", str),
+        "EntriesPerTaggedFriend": ("EntryRules", int),
+        "MaxTaggedFriends": ("EntryRules", int),
+        "MinAccountAgeDays": ("EntryRules", float),
+        "ScoringProcesses": ("EntryRules", int),
+        "BlocklistFile": ("Filters", str),
+        "AllowlistFile": ("Filters", str),
+        "NearDuplicateThreshold": ("Filters", float),
+        "NearDuplicateMinAccounts": ("Filters", int),
+        "NearDuplicateMinWords": ("Filters", int),
+    }
+    _TYPE_NAMES = {int: "a whole number", float: "a number", bool: "True or False"}
+
+    def __init__(self, config: configparser.RawConfigParser, overrides: dict = None, environment=None):
+        self._config = config
+        keys = {key.lower(): key for key in self._OPTIONS}
+        environment = environment if environment is not None else environ
+
+        self._overrides = {}
+        for key in self._OPTIONS:
+            value = environment.get(self.ENVIRONMENT_PREFIX + key.upper())
+            if value is not None:
+                self._overrides[key] = value
+        for key, value in (overrides or {}).items():
+            if key.lower() not in keys:
+                raise RuntimeError("Unknown config key '{}'.".format(key))
+            self._overrides[keys[key.lower()]] = value
+
+    @classmethod
+    def from_file(cls, filename: str, overrides: dict = None, environment=None):
+        config = configparser.RawConfigParser()
+        config.read(filename)
+        return cls(config, overrides, environment)
+
+    @property
+    def sections(self):
+        return self._config.sections()
+
+    def get(self, key: str, default=None, section: str = None):
+        # default=None means the key is required
+        option_section, kind = self._OPTIONS[key]
+        section = section or option_section
+
+        if key in self._overrides:
+            value = self._overrides[key]
+        else:
+            value = get_config_param(self._config, section, key, default=default)
+            if value is default:
+                return default
 
-    if not path.isfile(config_file_name):
-        print("Please ensure file: {} is located in the same directory as this file.".format(config_file_name))
-        click.pause("\n\nPress any key to exit...")
+        try:
+            if kind is bool:
+                return self._config.BOOLEAN_STATES[value.strip().lower()]
+            return kind(value)
+        except (KeyError, ValueError):
+            raise RuntimeError("Key '{}' under section '{}' must be {}, not '{}'.".format(key, section, self._TYPE_NAMES[kind], value))
 
-        raise SystemExit("Please ensure file: {} is located in the same directory as this file.".format(config_file_name))
 
-    config = configparser.RawConfigParser()
-    config.read(config_file_name)
+@functools.lru_cache(maxsize=None)
+def get_timezone(timezone_string: str):
+    # Every giveaway in a batch usually shares one timezone
+    try:
+        return pytz.timezone(timezone_string)
+    except pytz.exceptions.UnknownTimeZoneError:
+        raise RuntimeError("'{}' is not a valid TZ database timezone name.".format(timezone_string))
+
+
+def _config_datetime(config: GiveawayConfig, details_section: str, prefix: str, timezone):
+    # Reads GiveawayStartYear ... GiveawayStartMinute (or End) as a UTC time
+    parts = [config.get(prefix + part, section=details_section) for part in ("Year", "Month", "Day", "Hour", "Minute")]
+    try:
+        local_time = datetime.datetime(*parts)
+        return timezone.localize(local_time, is_dst=None).astimezone(pytz.utc)
+    except ValueError as e:
+        raise RuntimeError("The {} date/time in section '{}' is not valid: {}.".format(prefix, details_section, e))
+    except pytz.exceptions.InvalidTimeError:
+        raise RuntimeError("The {} time {} does not exist or is ambiguous in {} (daylight saving change).".format(prefix, local_time, timezone))
+
+
+def load_giveaway_settings(config, details_section='GiveawayDetails'):
+    # Reads one giveaway out of a config file (a GiveawayConfig, or a
+    # parsed ini file) and returns it as AutomaticTwitterGiveaways keyword
+    # arguments. A file may describe several giveaways in sections named
+    # "GiveawayDetails <anything>"; they all share the file's other sections.
+    if not isinstance(config, GiveawayConfig):
+        config = GiveawayConfig(config)
+
+    settings = {}
+
+    settings["your_user_name"] = config.get('TwitterUsername')
+    settings["bearer_token"] = config.get('BearerToken')
+
+    settings["giveaway_tweet_url"] = config.get('GiveawayTweetURL', section=details_section)
+    settings["giveaway_hashtag"] = config.get('GiveawayTweetHashtag', section=details_section)
+
+    # The window is converted to UTC once here, not by every instance
+    settings["timezone_string"] = config.get('GiveawayTimezone', section=details_section)
+    timezone = get_timezone(settings["timezone_string"])
+    settings["date_start"] = _config_datetime(config, details_section, "GiveawayStart", timezone)
+    settings["date_end"] = _config_datetime(config, details_section, "GiveawayEnd", timezone)
+    if settings["date_end"] <= settings["date_start"]:
+        raise RuntimeError("The giveaway in section '{}' ends before it starts.".format(details_section))
+
+    settings["output_to_csv"] = config.get("OutputRetweetsAndFollows")
+    settings["csv_output_filename"] = config.get("OutputFileName")
+
+    settings["entrants_file"] = config.get("EntrantsFile", default="") or None
+    settings["actions_file"] = config.get("ActionsFile", default="") or None
+
+    settings["debug"] = config.get('Debug')
+
+    settings["concurrent_fetch"] = config.get('ConcurrentFetch', default=False)
+    settings["connect_timeout"] = config.get('ConnectTimeout', default=5.0)
+    settings["read_timeout"] = config.get('ReadTimeout', default=30.0)
+    settings["max_retries"] = config.get('MaxRetries', default=5)
+    settings["retry_backoff"] = config.get('RetryBackoff', default=1.0)
+
+    follower_cache_filename = config.get('FollowerCacheFile', default="")
+    follower_cache_ttl = config.get('FollowerCacheTTLHours', default=1.0)
+    if follower_cache_filename:
+        settings["follower_cache"] = FollowerCache(follower_cache_filename, follower_cache_ttl)
+
+    settings["search_endpoint"] = config.get('SearchEndpoint', default="recent").lower()
+    if settings["search_endpoint"] not in AutomaticTwitterGiveaways._SEARCH_ENDPOINTS:
+        raise RuntimeError("SearchEndpoint must be either 'recent' or 'all'.")
+    settings["search_slices"] = config.get('SearchSlices', default=1)
+    if settings["search_slices"] < 1:
+        raise RuntimeError("SearchSlices must be at least 1.")
+    settings["early_exit_followers"] = config.get('EarlyExitFollowerCheck', default=False)
+    settings["checkpoint_dir"] = config.get('CheckpointDirectory', default="") or None
+
+    settings["timing_report"] = config.get('TimingReport', default=False)
+    settings["metrics_file"] = config.get('MetricsFile', default="") or None
+    settings["metrics_format"] = config.get('MetricsFormat', default="json").lower()
+    if settings["metrics_format"] not in ("json", "prometheus"):
+        raise RuntimeError("MetricsFormat must be either 'json' or 'prometheus'.")
+
+    settings["number_of_winners"] = config.get('NumberOfWinners', default=1)
+    if settings["number_of_winners"] < 1:
+        raise RuntimeError("NumberOfWinners must be at least 1.")
+    draw_seed = config.get('Seed', default="")
+    settings["draw_seed"] = int(draw_seed) if draw_seed.isdigit() else (draw_seed or None)
+    settings["audit_filename"] = config.get('AuditFileName', default="") or None
+
+    comment_pattern = config.get('CommentPattern', default="")
+    entries_per_tagged_friend = config.get('EntriesPerTaggedFriend', default=0)
+    max_tagged_friends = config.get('MaxTaggedFriends', default=10)
+    min_account_age_days = config.get('MinAccountAgeDays', default=0.0)
+    if comment_pattern or entries_per_tagged_friend > 0 or min_account_age_days > 0:
+        try:
+            settings["entry_rules"] = EntryRules(comment_pattern, entries_per_tagged_friend,
+                                                 max_tagged_friends, min_account_age_days)
+        except re.error as e:
+            raise RuntimeError("CommentPattern is not a valid regular expression: {}".format(e))
+    settings["scoring_processes"] = config.get('ScoringProcesses', default=0)
+
+    blocklist_file = config.get('BlocklistFile', default="")
+    allowlist_file = config.get('AllowlistFile', default="")
+    settings["blocklist"] = load_account_list(blocklist_file) if blocklist_file else None
+    settings["allowlist"] = load_account_list(allowlist_file) if allowlist_file else None
+    settings["near_duplicate_threshold"] = config.get('NearDuplicateThreshold', default=0.0)
+    if not 0 <= settings["near_duplicate_threshold"] <= 1:
+        raise RuntimeError("NearDuplicateThreshold must be between 0 and 1.")
+    settings["near_duplicate_min_accounts"] = config.get('NearDuplicateMinAccounts', default=3)
+    settings["near_duplicate_min_words"] = config.get('NearDuplicateMinWords', default=6)
+
+    return settings
+
+
+def _per_giveaway_filename(filename: str, tweet_id: str):
+    # Keeps the outputs of giveaways in one batch from overwriting each other
+    if not filename:
+        return filename
+    directory, name = path.split(filename)
+    stem, dot, extension = name.partition(".")
+    return path.join(directory, "{}-{}{}{}".format(stem, tweet_id, dot, extension))
+
+
+def write_winners(output_path: str, winners: list, number_of_winners: int):
+    with open(output_path, 'w') as output_file:
+        if number_of_winners == 1:
+            output_file.write(json.dumps(winners[0].as_dict(), indent=2))
+        else:
+            output_file.write(json.dumps([winner.as_dict() for winner in winners], indent=2))
+
+
+def run_batch(config_file_names: list, resume=False, overrides: dict = None):
+    # Runs every giveaway found in the given config files without any
+    # prompts. Each account is looked up and has its followers fetched
+    # once; its giveaways then crawl their retweets and comments side by
+    # side, sharing one session and one set of rate-limit buckets.
+    # overrides apply to every giveaway (see GiveawayConfig).
+    accounts = {}
+    for config_file_name in config_file_names:
+        if not path.isfile(config_file_name):
+            raise RuntimeError("Config file '{}' was not found.".format(config_file_name))
+
+        config = GiveawayConfig.from_file(config_file_name, overrides)
+
+        sections = [section for section in config.sections if section.split(" ")[0] == 'GiveawayDetails']
+        if not sections:
+            raise RuntimeError("Config file '{}' has no GiveawayDetails section.".format(config_file_name))
+
+        for section in sections:
+            settings = load_giveaway_settings(config, section)
+            account = (settings["your_user_name"], settings["bearer_token"])
+            accounts.setdefault(account, []).append(settings)
+
+    results = []
+    for (user_name, _), giveaways in accounts.items():
+        scheduler = RateLimitScheduler(AutomaticTwitterGiveaways._REQUEST_TIMEOUT)
+        # Every giveaway crawls its retweets and comments (one connection per
+        # time slice each) at the same time over the shared session, after
+        # the one follower crawl
+        pool_size = sum(2 * settings["search_slices"] + 1 for settings in giveaways) + 1
+
+        instances = []
+        for settings in giveaways:
+            tweet_id = settings["giveaway_tweet_url"].rstrip("/").split("/")[-1]
+            settings["csv_output_filename"] = _per_giveaway_filename(settings["csv_output_filename"], tweet_id)
+            settings["audit_filename"] = _per_giveaway_filename(settings["audit_filename"], tweet_id)
+            settings["metrics_file"] = _per_giveaway_filename(settings["metrics_file"], tweet_id)
+            settings["entrants_file"] = _per_giveaway_filename(settings["entrants_file"], tweet_id)
+            settings["actions_file"] = _per_giveaway_filename(settings["actions_file"], tweet_id)
+            settings["concurrent_fetch"] = True
+
+            if instances:
+                settings["user_id"] = instances[0].user_id
+                settings["session"] = instances[0].session
+            else:
+                settings["pool_size"] = pool_size
+            instances.append(AutomaticTwitterGiveaways(**settings, scheduler=scheduler, resume=resume))
+
+        print("Retrieving followers of {} for {} giveaways...".format(user_name, len(instances)))
+        follower_ids = instances[0].fetch_follower_ids()
+        print("Found {} Followers.".format(len(follower_ids)))
+
+        with ThreadPoolExecutor(max_workers=len(instances)) as executor:
+            futures = [executor.submit(instance.pick_winners, follower_ids) for instance in instances]
+
+            for instance, settings, future in zip(instances, giveaways, futures):
+                try:
+                    winners = future.result()
+                except Exception as e:
+                    print("[FAIL] Could not pick winner for {}: \n{}".format(settings["giveaway_tweet_url"], str(e)))
+                    winners = None
+
+                output_path = None
+                if winners:
+                    output_path = _per_giveaway_filename("winner.json", instance.giveaway_tweet_id)
+                    write_winners(output_path, winners, settings["number_of_winners"])
+                results.append((settings["giveaway_tweet_url"], winners, output_path))
+
+    print("-" * 80)
+    print("{:^80}".format("Batch Results"))
+    print("-" * 80)
+    for tweet_url, winners, output_path in results:
+        if winners is None:
+            outcome = "FAILED"
+        elif not winners:
+            outcome = "No qualified entries"
+        else:
+            outcome = "{} -> {}".format(", ".join("@" + winner.username for winner in winners), output_path)
+        print("{:<60}{}".format(tweet_url, outcome))
+
+    return results
 
-    
-    twitter_username = None
-    giveaway_tweet_url = None
-    giveaway_hashtag = None
-    bearer_token = None
 
-    date_start = None
-    date_end = None
-    timezone_string = None
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pick a winner for a Retweet, Comment, Follow Twitter giveaway.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the crawls of an earlier run that stopped part way, using its checkpoints.")
+    parser.add_argument("--batch", nargs="+", metavar="CONFIG_FILE",
+                        help="Run every giveaway in these config files without prompting.")
+    parser.add_argument("--watch", nargs="?", type=float, const=60.0, metavar="SECONDS",
+                        help="Poll for new retweets and comments every SECONDS (default 60) until the giveaway ends, then draw.")
+    parser.add_argument("--record", metavar="DIRECTORY",
+                        help="Save every Twitter API response to this directory.")
+    parser.add_argument("--replay", metavar="DIRECTORY",
+                        help="Answer requests from responses saved with --record instead of the Twitter API.")
+    parser.add_argument("--replay-rate-limit", type=int, metavar="REQUESTS",
+                        help="With --replay, allow each endpoint this many requests per 15 minutes, as the API does (default: no limit).")
+    parser.add_argument("--config", metavar="CONFIG_FILE", default='twitter_giveaway_config.ini',
+                        help="Config file to use (default: twitter_giveaway_config.ini).")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", dest="overrides",
+                        help="Override a config file key, e.g. --set NumberOfWinners=3. May be repeated.")
+    args = parser.parse_args()
+
+    overrides = {}
+    for override in args.overrides:
+        key, separator, value = override.partition("=")
+        if not separator:
+            parser.error("--set expects KEY=VALUE, got '{}'".format(override))
+        overrides[key.strip()] = value
+
+    if args.batch:
+        try:
+            run_batch(args.batch, args.resume, overrides)
+        except RuntimeError as e:
+            raise SystemExit("\n[FAIL] {}\n".format(str(e)))
+        raise SystemExit(0)
+
+    # Only the interactive run prompts
+    import click
+
+    config_file_name = args.config
 
-    output_retweets_to_csv = None
-    csv_output_name = None
+    if not path.isfile(config_file_name):
+        print("Please ensure file: {} is located in the same directory as this file.".format(config_file_name))
+        click.pause("\n\nPress any key to exit...")
 
-    debug = False
+        raise SystemExit("Please ensure file: {} is located in the same directory as this file.".format(config_file_name))
 
     try:
-        twitter_username = get_config_param(config, 'TwitterAuthentication','TwitterUsername')
-        bearer_token = get_config_param(config, 'TwitterAuthentication','BearerToken')
-
-        giveaway_tweet_url = get_config_param(config, 'GiveawayDetails','GiveawayTweetURL')
-        giveaway_hashtag = get_config_param(config, 'GiveawayDetails','GiveawayTweetHashtag')
-
-        yearStart = get_config_param(config, 'GiveawayDetails','GiveawayStartYear')
-        monthStart = get_config_param(config, 'GiveawayDetails','GiveawayStartMonth')
-        dayStart = get_config_param(config, 'GiveawayDetails','GiveawayStartDay')
-        hourStart = get_config_param(config, 'GiveawayDetails', 'GiveawayStartHour')
-        minuteStart = get_config_param(config, 'GiveawayDetails', 'GiveawayStartMinute')
-        date_start = datetime.datetime(
-            int(yearStart),
-            int(monthStart),
-            int(dayStart),
-            int(hourStart),
-            int(minuteStart))
-
-        yearEnd = get_config_param(config, 'GiveawayDetails','GiveawayEndYear')
-        monthEnd = get_config_param(config, 'GiveawayDetails','GiveawayEndMonth')
-        dayEnd = get_config_param(config, 'GiveawayDetails','GiveawayEndDay')
-        hourEnd = get_config_param(config, 'GiveawayDetails', 'GiveawayEndHour')
-        minuteEnd = get_config_param(config, 'GiveawayDetails', 'GiveawayEndMinute')
-        date_end = datetime.datetime(
-            int(yearEnd),
-            int(monthEnd),
-            int(dayEnd),
-            int(hourEnd),
-            int(minuteEnd))
-        timezone_string = get_config_param(config, "GiveawayDetails", "GiveawayTimezone")
-
-        output_retweets_to_csv = get_config_param(config, "ListOutput", "OutputRetweetsAndFollows", True)
-        csv_output_name = get_config_param(config, "ListOutput", "OutputFileName")
-
-        debug = get_config_param(config, 'DEBUG', 'Debug', True)
-
+        settings = load_giveaway_settings(GiveawayConfig.from_file(config_file_name, overrides))
     except RuntimeError as e:
         raise SystemExit("\n[FAIL] {}\n".format(str(e)))
 
-    t = AutomaticTwitterGiveaways(twitter_username,
-                        giveaway_hashtag,
-                        giveaway_tweet_url,
-                        bearer_token,
-                        date_start,
-                        date_end,
-                        timezone_string,
-                        output_retweets_to_csv,
-                        csv_output_name,
-                        debug)
-
-    winner = None
+    if args.replay:
+        settings["session"] = ReplaySession(args.replay, rate_limit=args.replay_rate_limit)
+
+    t = AutomaticTwitterGiveaways(**settings, resume=args.resume, record_dir=args.record)
+
+    winners = []
     try:
-        winner = t.pick_winner()
+        winners = t.watch(args.watch) if args.watch else t.pick_winners()
     except Exception as e:
         print("[FAIL] Could not pick winner: \n{}".format(str(e)))
         
 
-    if winner:
+    if winners:
         if click.confirm("Would you like to write this information to winner.json?", default=True):
             output_path = "winner.json"
-            with open(output_path, 'w') as output_file:
-                output_file.write(json.dumps(winner, indent=2))
+            write_winners(output_path, winners, settings["number_of_winners"])
             print("Winner written to: {}".format(output_path))
+            import webbrowser
             webbrowser.open(output_path)
 
     click.pause("\n\nPress any key to exit...")
-    
-
-    
-    
-
@@ -0,0 +1,269 @@
+import argparse
+import contextlib
+import datetime
+import importlib
+import io
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from urllib.parse import urlparse, parse_qsl
+
+from automatic_twitter_giveaways import AutomaticTwitterGiveaways, FollowerCache, ReplaySession
+
+# The client imports requests on first use; do it here so the first timed
+# run does not pay for it
+importlib.import_module("requests")
+
+# Runs pick_winners against made-up accounts served from memory, so fetch
+# pipeline changes can be measured without the Twitter API.
+
+_GIVEAWAY_TWEET_ID = "1478720942981500939"
+_ACCOUNT_ID = "1"
+
+# The giveaway window run_benchmark asks for (2022-01-05 16:00 to
+# 2022-01-10 00:00 in America/Chicago), in UTC as the search requests have it
+_WINDOW_START = datetime.datetime(2022, 1, 5, 22, 0, tzinfo=datetime.timezone.utc)
+_WINDOW_END = datetime.datetime(2022, 1, 10, 6, 0, tzinfo=datetime.timezone.utc)
+
+# name: (followers, retweets, comments, every retweeter follows)
+_DATASETS = {
+    "1k": (1000, 200, 150, False),
+    "100k": (100000, 20000, 15000, False),
+    # Entrants who followed to enter are the account's newest followers, so
+    # --early-exit can stop the follower crawl near the top of the list
+    "100k-followed": (100000, 20000, 15000, True),
+    "1m": (1000000, 200000, 150000, False),
+}
+
+
+# Seconds each startup step may take (median of fresh interpreters, less
+# the interpreter's own startup). --startup fails when one is over.
+_STARTUP_BUDGET = {
+    "import": 0.1,
+    "construct": 0.3,
+}
+
+# What a cron run does before its first API request. The account's user id
+# comes from the follower cache, so nothing here should touch the network.
+_STARTUP_STEPS = {
+    "import": "import automatic_twitter_giveaways",
+    "construct": (
+        "import datetime, sys\n"
+        "from automatic_twitter_giveaways import AutomaticTwitterGiveaways, FollowerCache\n"
+        "AutomaticTwitterGiveaways('account', 'NFT', 'https://twitter.com/account/status/{}', 'token',\n"
+        "                          datetime.datetime(2022, 1, 5, 16, 0), datetime.datetime(2022, 1, 10, 0, 0),\n"
+        "                          'America/Chicago', False, '', follower_cache=FollowerCache(sys.argv[1], 24))\n"
+    ).format(_GIVEAWAY_TWEET_ID),
+}
+
+
+class SyntheticTwitterSession(ReplaySession):
+    # Makes up API pages on request instead of reading recorded ones.
+    # Followers have ids 1000000..; every other retweeter is a follower (or,
+    # with entrants_follow, every one is, listed first) and every comment
+    # comes from a retweeter, so about half (or all) of the commenters
+    # qualify. Retweets and comments are spread evenly over the giveaway
+    # window and searches only return those between start_time and
+    # end_time, so time slices split the work as they would on the API.
+    # The CPU spent building pages is tracked so it can be taken out of the
+    # client's numbers.
+    def __init__(self, followers: int, retweets: int, comments: int, latency: float = 0.0, entrants_follow: bool = False):
+        super().__init__(latency=latency)
+        self._followers = followers
+        self._retweets = retweets
+        self._comments = comments
+        self._entrants_follow = entrants_follow
+        self.server_cpu_time = 0.0
+
+    def _user(self, number: int):
+        return {"id": str(1000000 + number), "username": "user{}".format(number), "name": "User {}".format(number)}
+
+    def _retweeter(self, number: int):
+        if self._entrants_follow:
+            return number
+        # Even retweeters are followers, odd ones are not
+        return number * 2 if number % 2 == 0 else self._followers + number
+
+    def _in_window(self, count: int, query: dict):
+        # Positions first..last-1 of count tweets spread evenly over the
+        # window fall between the query's start_time and end_time
+        step = (_WINDOW_END - _WINDOW_START).total_seconds() / count if count else 1.0
+
+        def position(name, default):
+            if name not in query:
+                return default
+            moment = datetime.datetime.strptime(query[name], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=datetime.timezone.utc)
+            return min(count, max(0, math.ceil((moment - _WINDOW_START).total_seconds() / step - 0.5)))
+
+        return position("start_time", 0), position("end_time", count)
+
+    def _page(self, last: int, offset: int, page_size: int, user_number, make_record, with_users: bool):
+        users = [user_number(position) for position in range(offset, min(offset + page_size, last))]
+        data = {"data": [make_record(number) for number in users], "meta": {"result_count": len(users)}}
+        if with_users:
+            data["includes"] = {"users": [self._user(number) for number in users]}
+        if offset + page_size < last:
+            data["meta"]["next_token"] = str(offset + page_size)
+        return data
+
+    def _respond(self, url: str):
+        started = time.thread_time()
+        parsed = urlparse(url)
+        query = dict(parse_qsl(parsed.query))
+        token = query.get("pagination_token", query.get("next_token"))
+
+        if "/by/username/" in parsed.path:
+            data = {"data": {"id": _ACCOUNT_ID, "username": "account", "name": "Account"}}
+        elif parsed.path.endswith("/followers"):
+            offset = int(token) if token is not None else 0
+            data = self._page(self._followers, offset, 1000, lambda position: position, self._user, False)
+        elif query.get("query", "").startswith("retweets_of:"):
+            first, last = self._in_window(self._retweets, query)
+            offset = int(token) if token is not None else first
+            data = self._page(last, offset, 100, self._retweeter, lambda number: {
+                "id": str(2000000000 + number),
+                "text": "RT",
+                "author_id": str(1000000 + number),
+                "referenced_tweets": [{"type": "retweeted", "id": _GIVEAWAY_TWEET_ID}]
+            }, True)
+        else:
+            first, last = self._in_window(self._comments, query)
+            offset = int(token) if token is not None else first
+            data = self._page(last, offset, 100, self._retweeter, lambda number: {
+                "id": str(3000000000 + number),
+                "text": "#NFT count me in",
+                "author_id": str(1000000 + number)
+            }, True)
+
+        body = json.dumps(data)
+        self.server_cpu_time += time.thread_time() - started
+        return 200, body, {"content-type": "application/json"}
+
+
+def _pick_winners(session: SyntheticTwitterSession, giveaway_options: dict):
+    with contextlib.redirect_stdout(io.StringIO()):
+        giveaway = AutomaticTwitterGiveaways("account",
+                                             "NFT",
+                                             "https://twitter.com/account/status/{}".format(_GIVEAWAY_TWEET_ID),
+                                             "token",
+                                             datetime.datetime(2022, 1, 5, 16, 0),
+                                             datetime.datetime(2022, 1, 10, 0, 0),
+                                             "America/Chicago",
+                                             False,
+                                             "",
+                                             session=session,
+                                             draw_seed=0,
+                                             **giveaway_options)
+        return giveaway.pick_winners()
+
+
+def run_benchmark(name: str, latency: float, giveaway_options: dict):
+    followers, retweets, comments, entrants_follow = _DATASETS[name]
+
+    # tracemalloc slows everything down several times over, so times come
+    # from one run and peak memory from a second, traced one
+    session = SyntheticTwitterSession(followers, retweets, comments, latency, entrants_follow)
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    winners = _pick_winners(session, giveaway_options)
+    wall_time = time.perf_counter() - wall_started
+    cpu_time = time.process_time() - cpu_started - session.server_cpu_time
+
+    # Includes the synthetic server's pages while they are being built
+    tracemalloc.start()
+    _pick_winners(SyntheticTwitterSession(followers, retweets, comments, latency, entrants_follow), giveaway_options)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "dataset": name,
+        "requests": session.request_count,
+        "wall_seconds": wall_time,
+        "cpu_seconds": cpu_time,
+        "peak_memory_mb": peak_memory / (1024 * 1024),
+        "winners": len(winners)
+    }
+
+
+def _median_run_time(code: str, runs: int, *args):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code] + list(args), check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def run_startup_benchmark(runs: int):
+    with tempfile.TemporaryDirectory() as directory:
+        cache_filename = os.path.join(directory, "followers_cache.sqlite3")
+        FollowerCache(cache_filename, 24).save_user_id("account", _ACCOUNT_ID)
+
+        interpreter = _median_run_time("pass", runs)
+        results = []
+        for step, code in _STARTUP_STEPS.items():
+            seconds = _median_run_time(code, runs, cache_filename) - interpreter
+            results.append({
+                "step": step,
+                "seconds": seconds,
+                "budget_seconds": _STARTUP_BUDGET[step],
+                "within_budget": seconds <= _STARTUP_BUDGET[step]
+            })
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark AutomaticTwitterGiveaways.pick_winners against synthetic accounts.")
+    parser.add_argument("--datasets", nargs="+", choices=list(_DATASETS), default=["1k", "100k"],
+                        help="Which synthetic accounts to run (default: 1k 100k).")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds of simulated network latency per request.")
+    parser.add_argument("--concurrent", action="store_true", help="Turn on ConcurrentFetch.")
+    parser.add_argument("--early-exit", action="store_true", help="Turn on EarlyExitFollowerCheck.")
+    parser.add_argument("--slices", type=int, default=1, help="SearchSlices to split the giveaway window into.")
+    parser.add_argument("--startup", action="store_true",
+                        help="Time module import and construction in fresh interpreters against the startup budget instead.")
+    parser.add_argument("--runs", type=int, default=10, help="Interpreters to start per --startup step (default: 10).")
+    parser.add_argument("--json", metavar="FILE", help="Also write the results to this file as JSON.")
+    args = parser.parse_args()
+
+    if args.startup:
+        print("{:<12}{:>12}{:>12}".format("Step", "Time (s)", "Budget (s)"))
+        results = run_startup_benchmark(args.runs)
+        for result in results:
+            print("{:<12}{:>12.3f}{:>12.3f}{}".format(result["step"],
+                                                    result["seconds"],
+                                                    result["budget_seconds"],
+                                                    "" if result["within_budget"] else "  OVER BUDGET"))
+        if args.json:
+            with open(args.json, 'w') as output_file:
+                output_file.write(json.dumps(results, indent=2))
+        raise SystemExit(0 if all(result["within_budget"] for result in results) else 1)
+
+    options = {
+        "concurrent_fetch": args.concurrent,
+        "early_exit_followers": args.early_exit,
+        "search_slices": args.slices
+    }
+
+    print("{:<15}{:>10}{:>12}{:>12}{:>16}".format("Dataset", "Requests", "Wall (s)", "CPU (s)", "Peak Mem (MB)"))
+    results = []
+    for dataset in args.datasets:
+        result = run_benchmark(dataset, args.latency, options)
+        results.append(result)
+        print("{:<15}{:>10}{:>12.2f}{:>12.2f}{:>16.1f}".format(result["dataset"],
+                                                              result["requests"],
+                                                              result["wall_seconds"],
+                                                              result["cpu_seconds"],
+                                                              result["peak_memory_mb"]))
+    print("Wall time and peak memory include building the synthetic server's pages; CPU time does not.")
+
+    if args.json:
+        with open(args.json, 'w') as output_file:
+            output_file.write(json.dumps(results, indent=2))
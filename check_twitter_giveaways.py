@@ -0,0 +1,287 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+
+from automatic_twitter_giveaways import (AccountList, ActionFilter, AutomaticTwitterGiveaways, EntryRules,
+                                         NearDuplicateDetector, weighted_sample)
+from benchmark_twitter_giveaways import SyntheticTwitterSession, _GIVEAWAY_TWEET_ID
+
+# Offline regression checks for the parts of the draw that decide who wins.
+# Everything runs against fixed seeds and made-up accounts, so a run gives
+# the same result every time and needs no Twitter API access. Exits with an
+# error if any check fails.
+
+_CHECKS = {}
+
+
+def _check(function):
+    _CHECKS[function.__name__[len("check_"):]] = function
+    return function
+
+
+def _expect(condition: bool, message: str):
+    if not condition:
+        raise AssertionError(message)
+
+
+class TaggingTwitterSession(SyntheticTwitterSession):
+    # SyntheticTwitterSession whose commenters tag 0-3 friends each, so
+    # weighted entry rules give them different numbers of entries. Only
+    # every fourth user qualifies there, hence number // 4.
+    def _respond(self, url: str):
+        status_code, body, headers = super()._respond(url)
+        if "conversation_id" in url:
+            data = json.loads(body)
+            for tweet in data.get("data", []):
+                number = int(tweet["author_id"])
+                tweet["text"] += "".join(" @friend{}".format(number * 7 + friend) for friend in range(number // 4 % 4))
+            body = json.dumps(data)
+        return status_code, body, headers
+
+
+class CommentingTwitterSession(SyntheticTwitterSession):
+    # SyntheticTwitterSession where 40 users all retweet, follow and
+    # comment, with these comments:
+    #   0-4    one copy-paste template, changed only by tagged friends, links
+    #          and capitals (a ring)
+    #   5-9    the same short "count me in" with tags
+    #   10-29  the same opening line with each user's own reason after it
+    #   30-39  the default "#NFT count me in"
+    _RING = "Wow this project is amazing, the team is doing great work, to the moon! #NFT"
+
+    def __init__(self):
+        super().__init__(200, 40, 40, entrants_follow=True)
+
+    def _comment(self, number: int):
+        if number < 5:
+            text = self._RING.upper() if number % 2 else self._RING
+            return "{} @friend{} https://t.co/x{}".format(text, number, number)
+        if number < 10:
+            return "Count me in #NFT @friend{} @friend{}".format(number, number + 1)
+        if number < 30:
+            return "I would love to win this #NFT because {}".format(_reason(number))
+        return None
+
+    def _respond(self, url: str):
+        status_code, body, headers = super()._respond(url)
+        if "conversation_id" in url:
+            data = json.loads(body)
+            for tweet in data.get("data", []):
+                tweet["text"] = self._comment(int(tweet["author_id"]) - 1000000) or tweet["text"]
+            body = json.dumps(data)
+        return status_code, body, headers
+
+
+_REASON_WORDS = ("art", "colors", "my", "sister", "collects", "these", "since", "launch", "day", "community", "helped",
+                 "me", "learn", "design", "first", "project", "I", "ever", "followed", "would", "frame", "it", "on",
+                 "wall", "love", "the", "roadmap", "and", "music", "drops")
+
+
+def _reason(number: int):
+    # Eight or more words of the user's own, the same on every run
+    rng = random.Random(number)
+    return " ".join(rng.choice(_REASON_WORDS) for _ in range(8 + number % 5))
+
+
+def _draw(session, **giveaway_options):
+    with contextlib.redirect_stdout(io.StringIO()):
+        giveaway = AutomaticTwitterGiveaways("account",
+                                             "NFT",
+                                             "https://twitter.com/account/status/{}".format(_GIVEAWAY_TWEET_ID),
+                                             "token",
+                                             datetime.datetime(2022, 1, 5, 16, 0),
+                                             datetime.datetime(2022, 1, 10, 0, 0),
+                                             "America/Chicago",
+                                             False,
+                                             "",
+                                             session=session,
+                                             **giveaway_options)
+        return giveaway, giveaway.draw()
+
+
+def _within(observed: int, expected: float, draws: int):
+    # Four standard deviations of a binomial count
+    return abs(observed - expected) <= 4 * (expected * (1 - expected / draws)) ** 0.5
+
+
+@_check
+def check_weighted_single_draw_distribution():
+    weights = [1, 2, 3, 4, 10]
+    draws = 100000
+    rng = random.Random(1)
+    counts = [0] * len(weights)
+    for _ in range(draws):
+        counts[weighted_sample(rng, weights, 1)[0]] += 1
+    for index, weight in enumerate(weights):
+        expected = draws * weight / sum(weights)
+        _expect(_within(counts[index], expected, draws),
+                "index {} drawn {} times, expected about {:.0f}".format(index, counts[index], expected))
+
+
+@_check
+def check_weighted_draw_without_replacement_distribution():
+    # Each ordered pair (first, second) should come up with probability
+    # w_i / W * w_j / (W - w_i), as for drawing tickets from a hat
+    weights = [1, 2, 3, 4, 10]
+    total = sum(weights)
+    draws = 100000
+    rng = random.Random(2)
+    counts = {}
+    for _ in range(draws):
+        pair = tuple(weighted_sample(rng, weights, 2))
+        _expect(pair[0] != pair[1], "the same index was picked twice: {}".format(pair))
+        counts[pair] = counts.get(pair, 0) + 1
+    for first, first_weight in enumerate(weights):
+        for second, second_weight in enumerate(weights):
+            if first == second:
+                continue
+            expected = draws * first_weight / total * second_weight / (total - first_weight)
+            observed = counts.get((first, second), 0)
+            _expect(_within(observed, expected, draws),
+                    "pair {} drawn {} times, expected about {:.0f}".format((first, second), observed, expected))
+
+
+@_check
+def check_weighted_draw_takes_everyone_when_short():
+    picked = weighted_sample(random.Random(3), [5, 1, 1], 10)
+    _expect(sorted(picked) == [0, 1, 2], "asked for more winners than entrants, got {}".format(picked))
+
+
+@_check
+def check_same_seed_same_winners():
+    rules = EntryRules(entries_per_tagged_friend=2)
+    results = []
+    for _ in range(2):
+        _, result = _draw(TaggingTwitterSession(2000, 400, 300), draw_seed=7, number_of_winners=3, entry_rules=rules)
+        results.append([winner.id for winner in result.winners])
+    _expect(results[0] == results[1], "seed 7 picked {} and then {}".format(*results))
+    _expect(len(results[0]) == 3, "expected 3 winners, got {}".format(results[0]))
+    _expect(result.audit["entry_count"] > result.audit["entrant_count"], "tagged friends earned no extra entries")
+
+    _, other = _draw(TaggingTwitterSession(2000, 400, 300), draw_seed=8, number_of_winners=3, entry_rules=rules)
+    _expect([winner.id for winner in other.winners] != results[0], "seeds 7 and 8 picked the same winners")
+
+
+@_check
+def check_process_pool_scoring_matches():
+    rules = EntryRules(entries_per_tagged_friend=2)
+    _, in_process = _draw(TaggingTwitterSession(2000, 400, 300), draw_seed=7, number_of_winners=3, entry_rules=rules)
+
+    session = TaggingTwitterSession(2000, 400, 300)
+    with contextlib.redirect_stdout(io.StringIO()):
+        giveaway = AutomaticTwitterGiveaways("account", "NFT",
+                                             "https://twitter.com/account/status/{}".format(_GIVEAWAY_TWEET_ID),
+                                             "token", datetime.datetime(2022, 1, 5, 16, 0),
+                                             datetime.datetime(2022, 1, 10, 0, 0), "America/Chicago", False, "",
+                                             session=session, draw_seed=7, number_of_winners=3,
+                                             entry_rules=rules, scoring_processes=2)
+        # Use the pool however few entrants there are
+        giveaway._PARALLEL_SCORING_MIN = 0
+        pooled = giveaway.draw()
+
+    _expect(pooled.audit["entrant_sha256"] == in_process.audit["entrant_sha256"],
+            "scoring in processes gave different entries")
+    _expect([winner.id for winner in pooled.winners] == [winner.id for winner in in_process.winners],
+            "scoring in processes picked different winners")
+
+
+@_check
+def check_ring_found_among_templated_comments():
+    # Many honest entrants answer with the same opening line or the same
+    # short "count me in"; only near-identical comments form a ring
+    ring = {"ring{}".format(number) for number in range(5)}
+    comment_texts = {
+        "ring{}".format(number): ["{} @friend{} https://t.co/x{}".format(
+            CommentingTwitterSession._RING.upper() if number % 2 else CommentingTwitterSession._RING, number, number)]
+        for number in range(5)
+    }
+    for number in range(300):
+        comment_texts["templated{}".format(number)] = ["I would love to win this #NFT because {}".format(_reason(number))]
+        comment_texts["short{}".format(number)] = ["Count me in #NFT @friend{} @friend{}".format(number, number + 1)]
+
+    rings = NearDuplicateDetector(0.8).find_rings(comment_texts)
+    _expect(rings == [ring], "expected one ring of {}, found {}".format(sorted(ring), [sorted(found) for found in rings]))
+
+
+@_check
+def check_account_list_parsing():
+    accounts = AccountList(["# giveaway bots", "", "@SpamBot", "  1000032  # by id", "987654321"])
+    _expect(accounts.matches("1", "spambot"), "usernames should match without the @ and in any case")
+    _expect(accounts.matches("1000032", "renamed"), "ids should match whatever the username")
+    _expect(accounts.matches("987654321", "someone") and accounts.matches("2", "987654321"),
+            "an all-digit line should match as an id and as a username")
+    _expect(not accounts.matches("1000033", "giveaway"), "comments should not be read as accounts")
+
+
+@_check
+def check_action_filter_duplicates():
+    action_filter = ActionFilter()
+
+    def comment(tweet_id, user_id, text):
+        return {"tweet_id": tweet_id, "user_id": user_id, "username": "user" + user_id, "text": text}
+
+    admitted = [
+        action_filter.admit("retweet", {"user_id": "1", "username": "user1"}),
+        action_filter.admit("retweet", {"user_id": "1", "username": "user1"}),
+        action_filter.admit("comment", comment("10", "1", "Count me in #NFT")),
+        action_filter.admit("comment", comment("10", "1", "Count me in #NFT")),
+        action_filter.admit("comment", comment("11", "1", "Count me in #NFT")),
+        action_filter.admit("comment", comment("12", "1", "Count me in again #NFT")),
+        action_filter.admit("comment", comment("13", "2", "Count me in #NFT")),
+    ]
+    _expect(admitted == [True, False, True, False, False, True, True],
+            "admitted {} instead of [True, False, True, False, False, True, True]".format(admitted))
+    _expect(action_filter.duplicates == 3, "counted {} duplicates instead of 3".format(action_filter.duplicates))
+
+
+@_check
+def check_blocklist_beats_allowlist():
+    # user31 and user32 are on both lists and must be blocked. user0 is an
+    # allowlisted ring member and stays; the rest of the ring goes.
+    blocklist = AccountList(["@User31", "1000032"])
+    allowlist = AccountList(["user31", "1000032", "@user0"])
+    with tempfile.TemporaryDirectory() as directory:
+        entrants_filename = os.path.join(directory, "entrants.ndjson")
+        _, result = _draw(CommentingTwitterSession(), draw_seed=7, blocklist=blocklist, allowlist=allowlist,
+                          near_duplicate_threshold=0.8, entrants_file=entrants_filename)
+        with open(entrants_filename, encoding="UTF-8") as file:
+            entrants = {json.loads(line)["username"] for line in file}
+
+    expected = {"user{}".format(number) for number in range(40)} - {"user1", "user2", "user3", "user4", "user31", "user32"}
+    _expect(entrants == expected, "unexpected entrants: missing {}, extra {}".format(sorted(expected - entrants),
+                                                                                   sorted(entrants - expected)))
+    _expect(result.filtered["blocked"] == 4,
+            "blocked {} retweets/comments instead of 4".format(result.filtered["blocked"]))
+    _expect(result.filtered["near_duplicate_accounts"] == 4,
+            "removed {} ring accounts instead of 4".format(result.filtered["near_duplicate_accounts"]))
+    _expect(not {"1000031", "1000032"} & {winner.id for winner in result.winners}, "a blocklisted account won")
+
+
+def run_checks(names: list):
+    failures = 0
+    for name in names:
+        try:
+            _CHECKS[name]()
+            print("PASS  {}".format(name))
+        except AssertionError as e:
+            failures += 1
+            print("FAIL  {}: {}".format(name, e))
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run offline regression checks of the draw and the entrant filters.")
+    parser.add_argument("checks", nargs="*", metavar="CHECK",
+                        help="Checks to run (default: all). One of: {}.".format(", ".join(_CHECKS)))
+    args = parser.parse_args()
+    for name in args.checks:
+        if name not in _CHECKS:
+            parser.error("unknown check: {}".format(name))
+
+    sys.exit(1 if run_checks(args.checks or list(_CHECKS)) else 0)